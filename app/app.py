@@ -1,14 +1,40 @@
-from classifier import build_and_save_classifier
-from flask import Flask, request, jsonify
-from tasks import add, scrape_movies_task
-from classifier import analyze_summary
-from database import SessionLocal, engine
-from models import Movie, Base
+import json
+import time
+from classifier import warm_up
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery_app import INFERENCE_MODE, INFERENCE_TIMEOUT
+from tasks import add, start_scrape, submit_predict, predict_batch_remote
+from classifier import analyze_summary, analyze_summaries, result_cache
+from database import session_scope, pool_stats
+from models import Movie
+from create_tables import ensure_schema
+import startup
+import metrics
+from movie_listing import (
+    SUMMARY_CHARS, parse_fields, parse_limit, fetch_page, iter_movies, json_array, json_lines,
+)
 
-Base.metadata.create_all(bind=engine)
+ensure_schema()
 
 app = Flask(__name__)
 
+MAX_BATCH_ITEMS = 10000
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def time_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # Route template, not the raw path, so ids and query strings don't add label values
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.labels("flask-web", request.method, route, response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
 @app.route("/")
 def home():
     return "Welcome to the Movie Scraper & KNN API! Use /scrape and /predict."
@@ -20,8 +46,8 @@ def scrape_movies():
     Usage: POST /scrape?limit=10
     """
     limit = int(request.args.get("limit", 250))
-    # Trigger Celery task
-    result = scrape_movies_task.delay(limit) 
+    # Page scrapes + the save/classifier update; the id is the update's, so it reports the whole run
+    result = start_scrape(limit)
     
     return { 
         "message": f"Scrape task queued for {limit} movies",
@@ -41,39 +67,114 @@ def predict():
         
     k = int(data.get("k", 5))
     
-    # This function pulls the latest vectors from Redis
-    results = analyze_summary(summary, k=k)
+    if INFERENCE_MODE == "celery":
+        task = submit_predict(summary, k)
+        try:
+            results = task.get(timeout=INFERENCE_TIMEOUT)
+        except CeleryTimeoutError:
+            return jsonify({"error": "Inference workers did not answer in time"}), 503
+        finally:
+            task.forget()
+    else:
+        # This function pulls the latest vectors from Redis
+        results = analyze_summary(summary, k=k)
     
     if isinstance(results, dict) and "error" in results:
         return jsonify(results), 404
         
     return jsonify(results)
 
+@app.post("/predict/batch")
+def predict_batch():
+    """
+    Scores many summaries in one go.
+    Body JSON: {"items": [{"summary": "...", "k": 5}, ...]}
+    Usage: POST /predict/batch?stream=true for NDJSON (one line per item, in order).
+    """
+    data = request.get_json() or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "No items provided"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"At most {MAX_BATCH_ITEMS} items per batch"}), 400
+    if any(not isinstance(item, dict) or not item.get("summary") for item in items):
+        return jsonify({"error": "Every item needs a summary"}), 400
+    items = [{"summary": item["summary"], "k": int(item.get("k", 5))} for item in items]
+
+    stream = request.args.get("stream", "false").lower() == "true"
+    if INFERENCE_MODE == "celery":
+        # The web process never loads the model; results stream only once the task is done
+        try:
+            results = predict_batch_remote(items)
+        except CeleryTimeoutError:
+            return jsonify({"error": "Inference workers did not answer in time"}), 503
+    else:
+        results = analyze_summaries(items, stream=stream)
+    if isinstance(results, dict) and "error" in results:
+        return jsonify(results), 404
+    if not stream:
+        return jsonify(results)
+
+    lines = (json.dumps({"index": i, "results": r}) + "\n" for i, r in enumerate(results))
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+@app.get("/predict/cache")
+def predict_cache_stats():
+    """Hit/miss counters of this worker's /predict result cache."""
+    return jsonify(result_cache.stats())
+
 @app.get("/movies")
 def get_movies():
-    """List all movies currently in the database."""
-    db = SessionLocal()
-    movies = db.query(Movie).all()
-    data = [{
-        "id": m.id,
-        "title": m.title,
-        "year": m.year,
-        "summary": m.summary[:100] + "..."
-    } for m in movies]
-    db.close()
-    return jsonify(data)
+    """
+    List movies by id, one keyset page at a time.
+    Usage: GET /movies?after_id=0&limit=100&fields=id,title,year&summary_chars=100
+    The next page starts after the X-Next-After-Id header. limit=0 streams the
+    whole table; format=ndjson streams one movie per line, from after_id to the
+    end unless a limit is given.
+    """
+    ndjson = request.args.get("format") == "ndjson"
+    try:
+        fields = parse_fields(request.args.get("fields"))
+        limit = parse_limit(request.args.get("limit"), ndjson)
+        after_id = int(request.args.get("after_id", 0))
+        summary_chars = int(request.args.get("summary_chars", SUMMARY_CHARS))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if limit == 0 or ndjson:
+        movies = iter_movies(fields, after_id, limit, summary_chars)
+        if ndjson:
+            return Response(stream_with_context(json_lines(movies)), mimetype="application/x-ndjson")
+        return Response(stream_with_context(json_array(movies)), mimetype="application/json")
+
+    with session_scope() as db:
+        data, next_after_id = fetch_page(db, fields, after_id, limit, summary_chars)
+    response = jsonify(data)
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
+    return response
 
 @app.route("/movies", methods=["DELETE"])
 def delete_movies():
     try:
-        db = SessionLocal()
-        num_deleted = db.query(Movie).delete()
-        db.commit()
-        db.close()
+        with session_scope() as db:
+            num_deleted = db.query(Movie).delete()
+            db.commit()
         return {"message": f"Deleted {num_deleted} movies"}
     except Exception as e:
         return {"error": str(e)}, 500
 
+@app.get("/db/pool")
+def db_pool_stats():
+    """Connection pool occupancy and checkout waits of this worker."""
+    return jsonify(pool_stats())
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus exposition: stage/request histograms plus cache, pool, queue and startup stats."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route("/test-task")
 def test_task():
     result = add.delay(10, 20)
@@ -82,7 +183,8 @@ def test_task():
 if __name__ == "__main__":
     # When the app starts, check if we need to build the cache
     print("Checking if NLP cache needs to be initialized...")
-    build_and_save_classifier()
+    warm_up()
+    startup.report("flask-web")
     
     # In Docker, we use 0.0.0.0 to be accessible from the host
     app.run(host="0.0.0.0", port=5000, debug=False)
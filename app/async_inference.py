@@ -0,0 +1,126 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import redis.asyncio as aioredis
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+import classifier
+from celery_app import INFERENCE_MODE, INFERENCE_TIMEOUT
+from tasks import submit_predict
+
+# CPU workers for spaCy + scoring (0 = use the event loop's default thread pool)
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", str(os.cpu_count() or 1)))
+# Distinct queries allowed in flight before /predict answers 503
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "64"))
+
+class Overloaded(Exception):
+    """Raised when the inference queue is full; the API turns it into a 503."""
+
+def _predict_in_worker(summary, k):
+    # Runs in a pool process: the forked copy of classifier keeps its own
+    # in-process index snapshot and result cache
+    return classifier.analyze_summary(summary, k=k)
+
+def _worker_pid():
+    return os.getpid()
+
+def _predict_remote(summary, k):
+    # Blocks a default-executor thread until an inference worker answers
+    result = submit_predict(summary, k)
+    try:
+        return result.get(timeout=INFERENCE_TIMEOUT)
+    except CeleryTimeoutError:
+        raise Overloaded("Inference workers did not answer in time")
+    finally:
+        result.forget()
+
+class InferencePool:
+    """
+    Non-blocking front of analyze_summary for the FastAPI app: the version check
+    uses an async Redis client, NLP and scoring run in a bounded process pool,
+    identical in-flight queries share one computation and new work is refused
+    once INFERENCE_MAX_PENDING queries are queued. With INFERENCE_MODE=celery
+    the work goes to the inference queue instead of local processes.
+    """
+
+    def __init__(self, processes=INFERENCE_PROCESSES, max_pending=INFERENCE_MAX_PENDING, mode=INFERENCE_MODE):
+        self.mode = mode
+        self.processes = processes if mode == "local" else 0
+        self.max_pending = max_pending
+        self.executor = None
+        self.redis = None
+        # key -> (future, executor it was submitted to)
+        self.inflight = {}
+        self.pool_restarts = 0
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        if self.processes > 0:
+            # fork: workers inherit the already imported spaCy model copy-on-write
+            self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("fork"))
+            # The pool forks its workers lazily on the first submit; force that now, during startup,
+            # rather than on the first /predict once the server's executor threads already exist
+            for future in [self.executor.submit(_worker_pid) for _ in range(self.processes)]:
+                future.result()
+            print(f"[INFERENCE] Forked {self.processes} pool processes")
+        self.redis = aioredis.Redis(host=classifier.REDIS_HOST, port=6379, db=0)
+
+    def _replace_pool(self, broken):
+        """
+        Swaps in a new pool after a worker died (e.g. OOM-killed), which leaves a
+        ProcessPoolExecutor broken for good. Only the first caller for a given
+        broken pool replaces it.
+        """
+        with self._pool_lock:
+            if broken is None or self.executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            # This process runs threads by now, so the replacement workers are forked from a
+            # single-threaded forkserver instead (they load the model on their first query)
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["classifier"])
+            self.executor = ProcessPoolExecutor(self.processes, mp_context=context)
+            self.pool_restarts += 1
+            print(f"[INFERENCE] A pool process died, replaced the pool (restart {self.pool_restarts})")
+
+    async def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    async def predict(self, summary, k=5):
+        version = await self.redis.get(classifier.VERSION_KEY)
+        if version is None:
+            return {"error": "No data found. Please run /scrape first."}
+
+        # Requests for the same text against the same index version are coalesced
+        key = (version, summary, k)
+        future, executor = self.inflight.get(key, (None, None))
+        if future is None:
+            if len(self.inflight) >= self.max_pending:
+                raise Overloaded()
+            loop = asyncio.get_running_loop()
+            if self.mode == "celery":
+                future = loop.run_in_executor(None, _predict_remote, summary, k)
+            else:
+                executor = self.executor
+                try:
+                    future = loop.run_in_executor(executor, _predict_in_worker, summary, k)
+                except BrokenProcessPool:
+                    self._replace_pool(executor)
+                    raise Overloaded("Inference pool is restarting, retry")
+            self.inflight[key] = (future, executor)
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        try:
+            # shield: a disconnecting client must not cancel work other callers wait on
+            return await asyncio.shield(future)
+        except BrokenProcessPool:
+            self._replace_pool(executor)
+            raise Overloaded("Inference pool is restarting, retry")
+
+    def stats(self):
+        return {"mode": self.mode, "in_flight": len(self.inflight), "max_pending": self.max_pending,
+                "processes": self.processes, "pool_restarts": self.pool_restarts}
@@ -1,5 +1,7 @@
 import os
+import redis
 from celery import Celery
+from metrics import register_stats
 
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")   # بیرون Docker → localhost
 REDIS_PORT = os.getenv("REDIS_PORT", "6379")
@@ -8,12 +10,40 @@ REDIS_DB = os.getenv("REDIS_DB", "0")
 BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 BACKEND_URL = BROKER_URL
 
+# "local": web processes score /predict themselves; "celery": they submit it to INFERENCE_QUEUE
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "local")
+INFERENCE_QUEUE = os.getenv("INFERENCE_QUEUE", "inference")
+# Saving scrapes + classifier updates; its worker runs --pool solo so spaCy can fork nlp.pipe processes
+REBUILD_QUEUE = os.getenv("REBUILD_QUEUE", "rebuild")
+# Seconds a web request waits for an inference worker (queued requests expire after it too)
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "10"))
+# The same for /predict/batch, which scores up to MAX_BATCH_ITEMS summaries in one task
+INFERENCE_BATCH_TIMEOUT = float(os.getenv("INFERENCE_BATCH_TIMEOUT", "120"))
+
 def make_celery():
     celery = Celery(
         "imdb_tasks",
         broker=BROKER_URL,
         backend=BACKEND_URL,
     )
+    # Inference gets its own queue so scrapes never delay /predict and vice versa
+    celery.conf.task_routes = {
+        "tasks.predict_task": {"queue": INFERENCE_QUEUE},
+        "tasks.predict_batch_task": {"queue": INFERENCE_QUEUE},
+        "tasks.finish_scrape_task": {"queue": REBUILD_QUEUE},
+    }
     return celery
 
 celery = make_celery()
+
+_broker = redis.Redis.from_url(BROKER_URL)
+
+def queue_lengths():
+    """Messages waiting in each Celery queue (the Redis broker keeps one list per queue)."""
+    queues = (celery.conf.task_default_queue, INFERENCE_QUEUE, REBUILD_QUEUE)
+    pipe = _broker.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+    return dict(zip(queues, pipe.execute()))
+
+register_stats("celery_queue_length", queue_lengths, label="queue")
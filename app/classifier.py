@@ -1,35 +1,102 @@
+import json
 import math
-import pickle
 import redis
 import os
+import threading
+import time
+from contextlib import contextmanager
 from collections import defaultdict, Counter
-import spacy
-from database import SessionLocal
+import numpy as np
+from database import session_scope
 from models import Movie
+from sparse_index import SparseIndex, RETRIEVAL_MODES, encode_rows, normalize_rows
+from lsh_index import LSHIndex, LSH_TABLES, LSH_BITS, LSH_SEED
+from text_cleaning import cleaning, clean_many, get_nlp, CLEANING_BACKEND
+from token_store import ensure_tokens, stream_tokens
+from result_cache import ResultCache
+from index_store import pack_index, unpack_index, to_chunks, from_chunks, write_index_file, open_index_file
+import startup
+from metrics import timed, register_stats
 
-# Redis Connection for Caching
+# Redis Connection for Caching (connects on first command, reconnects after fork)
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 r = redis.Redis(host=REDIS_HOST, port=6379, db=0)
 
-nlp = spacy.load("en_core_web_sm")
+# Every published version lives under its own keys and is never modified:
+#   classifier:v{n}           packed index (see index_store) as a list of chunks
+#   classifier:v{n}:manifest  how the chunks were encoded
+#   classifier:v{n}:state     document frequencies + IDF table the vectors were built with
+# VERSION_KEY points at the live version; publishing flips it atomically.
+INDEX_KEY_PREFIX = "classifier:v"
+VERSION_KEY = "classifier_version"
+# Counter used to reserve the next version number before the index file is written
+VERSION_SEQ_KEY = "classifier_version_seq"
+# version -> time it stopped being live; deleted INDEX_GC_GRACE_SECONDS later
+RETIRED_KEY = "classifier_retired_versions"
+# Held while building/publishing so replicas and workers never build concurrently
+BUILD_LOCK_KEY = "classifier_build_lock"
+# Keys of the single-key layout used before versioned publishing
+LEGACY_KEYS = ("classifier_data", "classifier_manifest", "classifier_state")
+# Readers that picked up the old pointer have this long to finish fetching it
+INDEX_GC_GRACE_SECONDS = int(os.getenv("INDEX_GC_GRACE_SECONDS", "300"))
+# Lock expiry (a crashed builder frees it after this) and how long others wait for it
+INDEX_BUILD_LOCK_TIMEOUT = int(os.getenv("INDEX_BUILD_LOCK_TIMEOUT", "3600"))
+INDEX_BUILD_LOCK_WAIT = int(os.getenv("INDEX_BUILD_LOCK_WAIT", "600"))
+# How often a worker asks Redis whether a new index was published (0 = every request)
+VERSION_CHECK_SECONDS = float(os.getenv("CLASSIFIER_VERSION_CHECK_SECONDS", "0"))
+# "matrix": full sparse mat-vec scan, "inverted": posting-list scoring with MaxScore pruning,
+# "ann": exact re-scoring of LSH candidates only (approximate, see lsh_index)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "matrix")
+# Build LSH tables into every published index (always on when RETRIEVAL_MODE is "ann")
+BUILD_ANN_INDEX = os.getenv("BUILD_ANN_INDEX", "0") == "1" or RETRIEVAL_MODE == "ann"
+# IDF drift (see idf_drift) tolerated by update_classifier before it re-weights every vector
+IDF_DRIFT_THRESHOLD = float(os.getenv("IDF_DRIFT_THRESHOLD", "0.05"))
+# Queries scored per sparse product in analyze_summaries (bounds the chunk x n_movies result)
+PREDICT_BATCH_CHUNK = int(os.getenv("PREDICT_BATCH_CHUNK", "64"))
 
-def cleaning(summary):
-    doc = nlp(summary)
-    words = [w for w in doc if not w.is_stop and not w.is_punct]
-    return " ".join(w.text for w in words)
+# Shared volume where the packed index is also written and mmapped by web workers ("" = off)
+INDEX_DIR = os.getenv("INDEX_DIR", "")
+
+# Decoded index kept in memory by each web/worker process. The snapshot dict is
+# replaced as a whole on reload so concurrent requests never mix two versions.
+_cache = {"snapshot": None, "checked_at": 0.0}
+_load_lock = threading.Lock()
+
+# /predict results, keyed by cleaned tokens + k + mode + index version
+result_cache = ResultCache(r)
+register_stats("result_cache", result_cache.stats, counters=("local_hits", "redis_hits", "misses"))
 
 def compute_tf(document):
     word_count = len(document)
+    if not word_count:
+        return {}
     word_freq = Counter(document)
     return {word: count / word_count for word, count in word_freq.items()}
 
-def compute_idf(documents):
-    idf_dict = defaultdict(int)
-    num_documents = len(documents)
+def compute_df(documents):
+    df_dict = defaultdict(int)
     for doc in documents:
         for word in set(doc):
-            idf_dict[word] += 1
-    return {word: math.log(num_documents / (count or 1)) + 1 for word, count in idf_dict.items()}
+            df_dict[word] += 1
+    return df_dict
+
+def idf_from_df(df_dict, num_documents):
+    return {word: math.log(num_documents / (count or 1)) + 1 for word, count in df_dict.items()}
+
+def compute_idf(documents):
+    return idf_from_df(compute_df(documents), len(documents))
+
+def idf_drift(old_idf, new_idf, df_dict):
+    """
+    Average relative change of the IDF weights, weighted by document frequency,
+    i.e. roughly how stale the weights stored in the vectors have become.
+    """
+    total = changed = 0.0
+    for word, count in df_dict.items():
+        if word in old_idf:
+            total += count
+            changed += count * abs(new_idf[word] - old_idf[word]) / old_idf[word]
+    return changed / total if total else 0.0
 
 def compute_tf_idf(documents):
     idf_dict = compute_idf(documents)
@@ -52,40 +119,437 @@ def knn(tf_idf_vectors, new_vector, k=5):
     similarities.sort(key=lambda x: x[1], reverse=True)
     return similarities[:k]
 
-def build_and_save_classifier():
-    """Triggered by Worker: Rebuilds vectors from DB and saves to Redis"""
-    print("[CLASSIFIER] Rebuilding vectors from DB...")
-    db = SessionLocal()
-    movies_data = db.query(Movie).all()
-    if not movies_data:
-        db.close()
+def _version_keys(version):
+    base = f"{INDEX_KEY_PREFIX}{int(version)}"
+    return base, f"{base}:manifest", f"{base}:state"
+
+def _publish(movie_list, index, state):
+    """
+    Writes the index file (if INDEX_DIR is set) and the new version's keys,
+    then flips VERSION_KEY to it in one MULTI/EXEC. Callers hold the build lock.
+    """
+    # Versions keep increasing across the switch from the plain INCR counter
+    r.setnx(VERSION_SEQ_KEY, int(r.get(VERSION_KEY) or 0))
+    version = r.incr(VERSION_SEQ_KEY)
+    if BUILD_ANN_INDEX and index.lsh is None:
+        # Full builds; incremental updates carry their tables over (see _update_lsh)
+        with timed("publish", "lsh"):
+            index.lsh = LSHIndex.build(index)
+    with timed("publish", "pack"):
+        # Queries must be cleaned the same way as the corpus they are compared with
+        blob = pack_index(movie_list, index, {"cleaning": state["cleaning"], "version": version})
+        if INDEX_DIR:
+            write_index_file(blob, INDEX_DIR)
+        chunks, manifest = to_chunks(blob)
+
+    data_key, manifest_key, state_key = _version_keys(version)
+    with timed("publish", "redis_write"):
+        pipe = r.pipeline(transaction=False)
+        pipe.delete(data_key)
+        pipe.rpush(data_key, *chunks)
+        pipe.set(manifest_key, json.dumps(manifest))
+        pipe.set(state_key, json.dumps(state))
+        pipe.execute()
+
+    # The version's keys are complete before anyone can see the pointer
+    previous = r.get(VERSION_KEY)
+    pipe = r.pipeline(transaction=True)
+    pipe.set(VERSION_KEY, version)
+    if previous is not None:
+        pipe.zadd(RETIRED_KEY, {int(previous): time.time()})
+    pipe.delete(*LEGACY_KEYS)
+    pipe.execute()
+    print(f"[CLASSIFIER] Published version {version}: {len(movie_list)} movies "
+          f"({manifest['bytes'] / 1e6:.1f} MB, {len(chunks)} chunks).")
+    _collect_retired_versions()
+
+def _collect_retired_versions():
+    """Deletes versions that stopped being live more than INDEX_GC_GRACE_SECONDS ago."""
+    expired = r.zrangebyscore(RETIRED_KEY, "-inf", time.time() - INDEX_GC_GRACE_SECONDS)
+    if not expired:
         return
-    
-    movie_list = [{"id": m.id, "title": m.title} for m in movies_data]
-    summaries = [cleaning(m.summary) for m in movies_data]
-    tokenized = [s.split() for s in summaries]
-    tf_idf_vectors = compute_tf_idf(tokenized)
-    
-    data_to_cache = {"movies": movie_list, "vectors": tf_idf_vectors}
-    r.set("classifier_data", pickle.dumps(data_to_cache))
-    db.close()
+    pipe = r.pipeline(transaction=True)
+    for version in expired:
+        pipe.delete(*_version_keys(version))
+    pipe.zrem(RETIRED_KEY, *expired)
+    pipe.execute()
+    print(f"[CLASSIFIER] Removed {len(expired)} retired index versions.")
+
+def _fetch_published():
+    """
+    Reads the live version's index and incremental state (versions are
+    immutable, so one MULTI/EXEC after reading the pointer is consistent).
+    Returns None if nothing (readable) has been published yet.
+    """
+    version = r.get(VERSION_KEY)
+    if version is None:
+        return None
+    data_key, manifest_key, state_key = _version_keys(version)
+    with timed("load_index", "redis_fetch"):
+        pipe = r.pipeline(transaction=True)
+        pipe.get(manifest_key)
+        pipe.lrange(data_key, 0, -1)
+        pipe.get(state_key)
+        manifest, chunks, state = pipe.execute()
+    if not manifest or not chunks:
+        return None
+
+    try:
+        with timed("load_index", "unpack"):
+            movie_list, index, meta = unpack_index(from_chunks(chunks, json.loads(manifest)))
+    except ValueError as e:
+        print(f"[CLASSIFIER] Published index is unreadable ({e}), rebuild required.")
+        return None
+    return {
+        "version": version,
+        "movies": movie_list,
+        "index": index,
+        "cleaning": meta.get("cleaning", "spacy"),
+        "state": json.loads(state) if state else None,
+    }
+
+class BuildLockTimeout(Exception):
+    """Another build held the lock for longer than INDEX_BUILD_LOCK_WAIT; nothing was applied."""
+
+class BuildLockExpired(Exception):
+    """
+    The build outlived INDEX_BUILD_LOCK_TIMEOUT, so the lock expired while it
+    ran and a concurrent build may have published over it.
+    """
+
+def _build_lock():
+    return r.lock(BUILD_LOCK_KEY, timeout=INDEX_BUILD_LOCK_TIMEOUT, blocking_timeout=INDEX_BUILD_LOCK_WAIT)
+
+@contextmanager
+def _holding_build_lock():
+    """Runs the block under the build lock; raises BuildLockTimeout / BuildLockExpired (see above)."""
+    lock = _build_lock()
+    if not lock.acquire():
+        raise BuildLockTimeout(f"Build lock still held after {INDEX_BUILD_LOCK_WAIT}s")
+    try:
+        yield
+    except BaseException:
+        # The block's own error wins over a lost lock
+        try:
+            lock.release()
+        except redis.exceptions.LockNotOwnedError:
+            pass
+        raise
+    try:
+        lock.release()
+    except redis.exceptions.LockNotOwnedError:
+        raise BuildLockExpired(f"Build took longer than INDEX_BUILD_LOCK_TIMEOUT ({INDEX_BUILD_LOCK_TIMEOUT}s); raise it")
+
+def _build_index(rows):
+    """
+    Builds the index in a single pass over (movie, tokens) rows: raw TF rows are
+    encoded first, then each column is weighted by its IDF once the document
+    frequencies are known. Returns (movie_list, index, df, idf).
+    """
+    movie_list = []
+
+    def tf_rows():
+        for movie, tokens in rows:
+            movie_list.append(movie)
+            yield compute_tf(tokens)
+
+    vocab = {}
+    indptr, indices, tf = encode_rows(tf_rows(), vocab, normalize=False)
+    terms = list(vocab)
+    # A word appears at most once per row, so column counts are document frequencies
+    df = dict(zip(terms, np.bincount(indices, minlength=len(terms)).tolist()))
+    idf = idf_from_df(df, len(movie_list))
+    idf_column = np.array([idf[w] for w in terms])
+    data = normalize_rows(indptr, tf * idf_column[indices])
+    return movie_list, SparseIndex(terms, indptr, indices, data, idf=idf_column), df, idf
+
+def _rebuild_from_db(db):
+    """Full rebuild from the stored tokens; only movies without tokens go through NLP."""
+    with timed("build", "tokens"):
+        ensure_tokens(db)
+    with timed("build", "index"):
+        movie_list, index, df, idf = _build_index(stream_tokens(db))
+    if not movie_list:
+        return False
+    with timed("build", "publish"):
+        _publish(movie_list, index, {"df": df, "idf": idf, "cleaning": CLEANING_BACKEND})
+    return True
+
+def build_and_save_classifier(if_missing=False):
+    """
+    Triggered by Worker: Rebuilds vectors from DB and saves to Redis.
+    With if_missing=True nothing happens once any version is published.
+    """
+    try:
+        with _holding_build_lock():
+            if if_missing and r.get(VERSION_KEY) is not None:
+                return
+            _build_and_save()
+    except BuildLockTimeout:
+        print("[CLASSIFIER] Another build is still running, skipping this one.")
+    except BuildLockExpired as e:
+        # The full build is published; a concurrent one can only have published the same DB state
+        print(f"[CLASSIFIER] Warning: {e}")
+
+def _build_and_save():
+    print("[CLASSIFIER] Rebuilding vectors from DB...")
+    with session_scope() as db:
+        if not _rebuild_from_db(db):
+            return
     print("[CLASSIFIER] Success: Vectors cached in Redis.")
 
-def analyze_summary(summary, k=5):
-    """Triggered by App: Pulls latest data from Redis and predicts"""
-    cached_data = r.get("classifier_data")
-    if not cached_data:
+def ensure_classifier():
+    """
+    Startup hook: loads the live version, building one only if nothing has
+    been published yet (the build lock keeps concurrent replicas to one build).
+    """
+    if load_classifier() is None:
+        build_and_save_classifier(if_missing=True)
+        load_classifier()
+
+def warm_up():
+    """
+    Loads the spaCy model and the live index ahead of the first request. Called
+    before forking (gunicorn master, inference pool) so children share both.
+    """
+    if CLEANING_BACKEND == "spacy":
+        with startup.stage("spacy_model"):
+            get_nlp()
+    with startup.stage("classifier_index"):
+        ensure_classifier()
+
+def update_classifier(changed_ids=None):
+    """
+    Runs _update_classifier under the build lock. Raises BuildLockTimeout or
+    BuildLockExpired; the caller retries with the same changed_ids (a changed
+    movie is re-indexed from the DB, so applying them twice is harmless).
+    """
+    with _holding_build_lock():
+        _update_classifier(changed_ids)
+
+def _update_lsh(lsh, keep_rows, index):
+    """
+    LSH tables for an incrementally updated index: the published tables with the
+    kept rows renumbered and only the added rows projected, as long as they were
+    built with the current LSH settings (None otherwise, so _publish builds them).
+    """
+    if lsh is None or lsh.params() != {"tables": LSH_TABLES, "bits": LSH_BITS, "seed": LSH_SEED}:
+        return None
+    return lsh.with_rows(keep_rows, index)
+
+def _update_classifier(changed_ids=None):
+    """
+    Triggered by Worker after a scrape: applies only the movies added to or deleted
+    from the DB since the last publish, plus changed_ids (movies whose summary was
+    updated in place, re-indexed as a delete + add). DF counts are updated in place (deleted
+    movies' words are read back from their index rows) and the existing vectors
+    keep their weights unless the IDF drift passes IDF_DRIFT_THRESHOLD, in which
+    case every vector is re-weighted from the stored tokens. Falls back to a full
+    build when nothing was published yet.
+    """
+    published = _fetch_published()
+    if published is None or published["state"] is None:
+        return _build_and_save()
+
+    state = published["state"]
+    if state.get("cleaning") != CLEANING_BACKEND:
+        print("[CLASSIFIER] Cleaning backend changed, running a full rebuild.")
+        return _build_and_save()
+
+    published_movies = published["movies"]
+    rows_by_id = {m["id"]: row for row, m in enumerate(published_movies)}
+
+    with session_scope() as db:
+        db_ids = {movie_id for (movie_id,) in db.query(Movie.id)}
+        changed = set(changed_ids or ()) & db_ids & rows_by_id.keys()
+        added_ids = (db_ids - rows_by_id.keys()) | changed
+        removed_ids = (rows_by_id.keys() - db_ids) | changed
+        if not added_ids and not removed_ids:
+            print("[CLASSIFIER] Index is up to date, nothing to do.")
+            return
+        print(f"[CLASSIFIER] Incremental update: +{len(added_ids)} / -{len(removed_ids)} movies.")
+
+        with timed("update", "tokens"):
+            ensure_tokens(db, ids=added_ids)
+            added = list(stream_tokens(db, ids=added_ids))
+
+        df = Counter(state["df"])
+        for movie_id in removed_ids:
+            df.subtract(published["index"].row_terms(rows_by_id[movie_id]))
+        for _, tokens in added:
+            df.update(set(tokens))
+        df = {word: count for word, count in df.items() if count > 0}
+
+        keep_rows = [row for row, m in enumerate(published_movies) if m["id"] not in removed_ids]
+        movie_list = [published_movies[row] for row in keep_rows] + [movie for movie, _ in added]
+        if not movie_list:
+            return
+
+        new_idf = idf_from_df(df, len(movie_list))
+        drift = idf_drift(state["idf"], new_idf, df)
+        if drift > IDF_DRIFT_THRESHOLD:
+            print(f"[CLASSIFIER] IDF drift {drift:.3f} > {IDF_DRIFT_THRESHOLD}, re-weighting all vectors.")
+            _rebuild_from_db(db)
+            return
+
+    # Keep the published weights; words never seen before get their current IDF
+    idf = state["idf"]
+    for word, value in new_idf.items():
+        idf.setdefault(word, value)
+    with timed("update", "index"):
+        new_vectors = [{w: tf * idf[w] for w, tf in compute_tf(tokens).items()} for _, tokens in added]
+        index = published["index"].with_rows(keep_rows, new_vectors, idf)
+    if BUILD_ANN_INDEX:
+        with timed("update", "lsh"):
+            index.lsh = _update_lsh(published["index"].lsh, keep_rows, index)
+
+    with timed("update", "publish"):
+        _publish(movie_list, index, {"df": df, "idf": idf, "cleaning": CLEANING_BACKEND})
+    print(f"[CLASSIFIER] Success: Index updated (IDF drift {drift:.3f}).")
+
+def _map_index_file(version):
+    """
+    mmaps the shared index file read-only (pages are shared by every process on
+    the host) and returns a snapshot if it holds the given published version.
+    """
+    buffer = open_index_file(INDEX_DIR)
+    if buffer is None:
+        return None
+    try:
+        with timed("load_index", "map_file"):
+            movies, index, meta = unpack_index(buffer)
+    except ValueError:
+        return None
+    if meta.get("version") != int(version):
+        # Writer already renamed a newer file, or this one is stale; use Redis this time
+        return None
+    return {"version": version, "movies": movies, "index": index, "cleaning": meta.get("cleaning", "spacy")}
+
+def load_classifier():
+    """
+    Returns the in-process copy of the index, reloading it (from the shared
+    INDEX_DIR file when possible, otherwise from Redis) only when
+    build_and_save_classifier has published a new version.
+    Returns None if nothing has been published yet.
+    """
+    now = time.monotonic()
+    snapshot = _cache["snapshot"]
+    if snapshot is not None and now - _cache["checked_at"] < VERSION_CHECK_SECONDS:
+        return snapshot
+
+    version = r.get(VERSION_KEY)
+    _cache["checked_at"] = now
+    if version is None:
+        return None
+    if snapshot is not None and version == snapshot["version"]:
+        return snapshot
+
+    with _load_lock:
+        snapshot = _cache["snapshot"]
+        if snapshot is not None and version == snapshot["version"]:
+            return snapshot
+        snapshot = _map_index_file(version) if INDEX_DIR else None
+        source = "shared file"
+        if snapshot is None:
+            published = _fetch_published()
+            if published is None:
+                return None
+            snapshot = {key: published[key] for key in ("version", "movies", "index", "cleaning")}
+            source = "Redis"
+
+        _cache["snapshot"] = snapshot
+        # Entries of the previous version can never hit again (the version is part of the key)
+        result_cache.local.clear()
+        print(f"[CLASSIFIER] Loaded index version {int(snapshot['version'])} "
+              f"({len(snapshot['movies'])} movies) from {source}.")
+    return snapshot
+
+def analyze_summary(summary, k=5, mode=None):
+    """
+    Triggered by App: Uses the in-process index (refreshed from Redis on new versions) and predicts.
+    mode overrides RETRIEVAL_MODE for this call (one of sparse_index.RETRIEVAL_MODES).
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        return {"error": f"Unknown retrieval mode '{mode}'. Use one of {', '.join(RETRIEVAL_MODES)}."}
+
+    with timed("predict", "load_index"):
+        loaded = load_classifier()
+    if loaded is None:
         return {"error": "No data found. Please run /scrape first."}
-    
-    data = pickle.loads(cached_data)
-    movies = data["movies"]
-    tf_idf_vectors = data["vectors"]
 
-    cleaned = cleaning(summary)
+    movies = loaded["movies"]
+    index = loaded["index"]
+
+    with timed("predict", "clean"):
+        cleaned = cleaning(summary, backend=loaded["cleaning"])
     token = cleaned.split()
-    
-    # Simple TF for the query; in a production system, use the global IDF here.
-    tf_new = compute_tf(token)
-    
-    neighbors = knn(tf_idf_vectors, tf_new, k=k)
-    return [{"title": movies[idx]["title"], "similarity": sim} for idx, sim in neighbors]
\ No newline at end of file
+
+    with timed("predict", "cache_lookup"):
+        cache_key = result_cache.make_key(token, k, mode, loaded["version"])
+        cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    with timed("predict", f"score_{mode}"):
+        # The index applies its IDF table to the query TF and normalizes it once
+        tf_new = compute_tf(token)
+
+        neighbors = index.search(tf_new, k=k, mode=mode)
+        results = [{"title": movies[idx]["title"], "similarity": sim} for idx, sim in neighbors]
+    result_cache.set(cache_key, results)
+    return results
+
+def analyze_summaries(items, mode=None, stream=False):
+    """
+    Batch version of analyze_summary for offline jobs. items is a list of
+    {"summary": str, "k": int} dicts; results come back in the same order.
+    All summaries are cleaned in one nlp.pipe pass and the cache misses are
+    scored PREDICT_BATCH_CHUNK at a time with one sparse product (rankings
+    are the same in every exact retrieval mode; "ann" re-scores each query's LSH
+    candidates instead). With stream=True a generator is
+    returned that yields each item's results as soon as its chunk is scored.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        return {"error": f"Unknown retrieval mode '{mode}'. Use one of {', '.join(RETRIEVAL_MODES)}."}
+
+    with timed("predict_batch", "load_index"):
+        loaded = load_classifier()
+    if loaded is None:
+        return {"error": "No data found. Please run /scrape first."}
+
+    results = _iter_batch_results(loaded, items, mode)
+    return results if stream else list(results)
+
+def _iter_batch_results(loaded, items, mode):
+    movies = loaded["movies"]
+    index = loaded["index"]
+    with timed("predict_batch", "clean"):
+        # Never fork nlp.pipe processes here: requests run in threaded processes (uvicorn
+        # threadpool, --pool threads inference worker); multi-process cleaning is for rebuilds
+        cleaned = clean_many([item["summary"] for item in items], n_process=1, backend=loaded["cleaning"])
+
+    for start in range(0, len(items), PREDICT_BATCH_CHUNK):
+        chunk = list(zip(items[start:start + PREDICT_BATCH_CHUNK], cleaned[start:start + PREDICT_BATCH_CHUNK]))
+        results = [None] * len(chunk)
+        misses = []
+        for i, (item, text) in enumerate(chunk):
+            token = text.split()
+            cache_key = result_cache.make_key(token, item["k"], mode, loaded["version"])
+            results[i] = result_cache.get(cache_key)
+            if results[i] is None:
+                misses.append((i, cache_key, index.query_vector(compute_tf(token))))
+
+        if misses:
+            with timed("predict_batch", f"score_{mode}"):
+                if mode == "ann" and index.lsh is not None:
+                    neighbors = [index.top_k_ann(query, chunk[i][0]["k"]) for i, _, query in misses]
+                else:
+                    neighbors = index.top_k_batch([query for _, _, query in misses],
+                                                  [chunk[i][0]["k"] for i, _, _ in misses])
+            for (i, cache_key, _), found in zip(misses, neighbors):
+                results[i] = [{"title": movies[idx]["title"], "similarity": sim} for idx, sim in found]
+                result_cache.set(cache_key, results[i])
+
+        yield from results
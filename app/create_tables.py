@@ -1,4 +1,59 @@
+"""
+Schema setup. ensure_schema() runs at web/worker startup; the destructive
+duplicate cleanup only runs when asked for:
+
+    python create_tables.py            # create tables + the natural-key index
+    python create_tables.py --dedupe   # first delete duplicate (title, year) rows
+"""
+import sys
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
 from database import Base, engine
-from models import Movie
+from models import Movie, MovieTokens  # noqa: F401  (registers the tables)
+
+NATURAL_KEY_INDEX = "uq_movies_title_year"
+
+
+def _has_natural_key_index():
+    return any(index["name"] == NATURAL_KEY_INDEX for index in inspect(engine).get_indexes("movies"))
+
+
+def dedupe_movies():
+    """Deletes duplicate (title, year) rows left by earlier scrapes, keeping the oldest. Returns the count."""
+    with engine.begin() as conn:
+        deleted = conn.execute(text(
+            "DELETE FROM movies WHERE id NOT IN (SELECT MIN(id) FROM movies GROUP BY title, year)"
+        )).rowcount
+    print(f"[DB] Removed {deleted} duplicate movies.")
+    return deleted
+
+
+def ensure_schema():
+    """
+    Creates missing tables and adds the (title, year) unique index that
+    ingest.upsert_movies' ON CONFLICT needs; create_all never adds indexes to a
+    table that already exists. Returns False (and says why) if the index could
+    not be created, e.g. because the table still holds duplicates.
+    """
+    Base.metadata.create_all(bind=engine)
+    if _has_natural_key_index():
+        return True
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {NATURAL_KEY_INDEX} ON movies (title, year)"))
+    except SQLAlchemyError as e:
+        # Another replica may have created it at the same time
+        if _has_natural_key_index():
+            return True
+        print(f"[DB] Could not add {NATURAL_KEY_INDEX} ({e.__class__.__name__}); scrapes cannot be saved until "
+              f"it exists. Run `python create_tables.py --dedupe` to drop duplicate movies first.")
+        return False
+    print(f"[DB] Added unique index {NATURAL_KEY_INDEX}.")
+    return True
+
 
-Base.metadata.create_all(bind=engine)
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    if "--dedupe" in sys.argv[1:]:
+        dedupe_movies()
+    sys.exit(0 if ensure_schema() else 1)
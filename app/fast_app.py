@@ -1,17 +1,32 @@
 # 1. ایمپورت‌ها (مرتب شده)
+import os
+import json
+import time
 import jwt
 import datetime
 from typing import List, Optional
-from fastapi import FastAPI, Depends, HTTPException, Query, Header, status
-from pydantic import BaseModel
+from fastapi import FastAPI, Depends, HTTPException, Query, Header, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from sqlalchemy import delete
 
 # فایل‌های پروژه
-from database import SessionLocal
+from database import session_scope, async_session_scope, async_engine, pool_stats
 from models import Movie
-from tasks import scrape_movies_task
-from classifier import analyze_summary, build_and_save_classifier
+from create_tables import ensure_schema
+from movie_listing import (
+    SUMMARY_CHARS, parse_fields, parse_limit, fetch_page, fetch_page_async, iter_movies, json_array, json_lines,
+)
+from tasks import start_scrape, predict_batch_remote
+from classifier import analyze_summaries, warm_up, result_cache
+from async_inference import InferencePool, Overloaded
+from result_cache import LRUCache
+from celery_app import INFERENCE_MODE
+import startup
+import metrics
 
 # 2. تنظیمات اپلیکیشن و JWT
 app = FastAPI(title="Movie Scraper API")
@@ -20,19 +35,24 @@ SECRET_KEY = "super_secret_key_change_me"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 7 
+MAX_BATCH_ITEMS = 10000
+# Verified access tokens kept per worker (0 disables) and the longest time a
+# verification may be reused by this process or by nginx's auth cache
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_MAX_AGE = int(os.getenv("AUTH_CACHE_MAX_AGE", "60"))
+_verified_tokens = LRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_MAX_AGE)
+
+# NLP + scoring for /predict run off the event loop in a bounded process pool
+inference = InferencePool()
+metrics.register_stats("inference", inference.stats, counters=("pool_restarts",))
 
 # 3. Pydantic Models
 class PredictRequest(BaseModel):
     summary: str
     k: int = 5
 
-class MovieResponse(BaseModel):
-    id: int
-    title: str
-    year: Optional[int]
-    summary: str
-    class Config:
-        from_attributes = True
+class BatchPredictRequest(BaseModel):
+    items: List[PredictRequest] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
 
 class TokenRequest(BaseModel):
     username: str
@@ -43,11 +63,12 @@ class RefreshRequest(BaseModel):
 
 # 4. Dependency Injection
 def get_db():
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         yield db
-    finally:
-        db.close()
+
+def _fetch_page_blocking(*args):
+    with session_scope() as db:
+        return fetch_page(db, *args)
 
 # 5. Helper Functions (توابع کمکی)
 def create_tokens(username: str):
@@ -70,11 +91,41 @@ def create_tokens(username: str):
 # 6. رویداد استارت‌آپ
 @app.on_event("startup")
 def startup_event():
+    # Runs in every uvicorn worker: the multiproc dir is cleared by the launch command instead
+    ensure_schema()
+    if INFERENCE_MODE == "celery":
+        # Thin web process: the inference workers own the model
+        inference.start()
+        startup.report("fast-web")
+        return
     print("FastAPI Starting: Loading NLP Model...")
     try:
-        build_and_save_classifier()
+        # spaCy model + published index; builds only if nothing is published yet
+        warm_up()
     except Exception as e:
         print(f"Error loading model: {e}")
+    # Started after the model is loaded so forked workers share it copy-on-write
+    inference.start()
+    startup.report("fast-web")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await inference.close()
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Route template, not the raw path, so ids and query strings don't add label values
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            "fast-web", request.method, route.path if route else "unmatched", status_code
+        ).observe(time.perf_counter() - start)
 
 # ==========================================
 #              ROUTES (EndPoints)
@@ -86,20 +137,93 @@ def home():
 
 @app.post("/scrape")
 def scrape_movies(limit: int = Query(250)):
-    result = scrape_movies_task.delay(limit)
+    # task_id succeeds once the movies are saved and the classifier is updated
+    result = start_scrape(limit)
     return {"message": "Queued", "task_id": result.id}
 
 @app.post("/predict")
-def predict(request: PredictRequest):
-    results = analyze_summary(request.summary, k=request.k)
+async def predict(request: PredictRequest):
+    try:
+        results = await inference.predict(request.summary, k=request.k)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e) or "Inference queue is full, retry later",
+                            headers={"Retry-After": "1"})
     if isinstance(results, dict) and "error" in results:
         raise HTTPException(status_code=404, detail=results["error"])
     return results
 
-@app.get("/movies", response_model=List[MovieResponse])
-def get_movies(db: Session = Depends(get_db)):
-    movies = db.query(Movie).all()
-    return movies
+@app.post("/predict/batch")
+def predict_batch(request: BatchPredictRequest, stream: bool = Query(False)):
+    items = [{"summary": item.summary, "k": item.k} for item in request.items]
+    if INFERENCE_MODE == "celery":
+        # The web process never loads the model; results stream only once the task is done
+        try:
+            results = predict_batch_remote(items)
+        except CeleryTimeoutError:
+            raise HTTPException(status_code=503, detail="Inference workers did not answer in time",
+                                headers={"Retry-After": "1"})
+    else:
+        results = analyze_summaries(items, stream=stream)
+    if isinstance(results, dict) and "error" in results:
+        raise HTTPException(status_code=404, detail=results["error"])
+    if not stream:
+        return results
+
+    # NDJSON: one line per item, in request order, sent as each chunk is scored
+    lines = (json.dumps({"index": i, "results": r}) + "\n" for i, r in enumerate(results))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@app.get("/predict/cache")
+def predict_cache_stats():
+    """Hit/miss counters of this worker's /predict result cache."""
+    # /predict itself runs in the pool processes; their local caches are not included here
+    return {**result_cache.stats(), "inference": inference.stats()}
+
+@app.get("/db/pool")
+def db_pool_stats():
+    """Connection pool occupancy and checkout waits of this worker."""
+    return pool_stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus exposition: stage/request histograms plus cache, pool, queue and startup stats."""
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@app.get("/movies")
+async def get_movies(
+    response: Response,
+    after_id: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = Query(None),
+    summary_chars: int = Query(SUMMARY_CHARS, ge=0),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    Keyset-paginated listing: pass X-Next-After-Id back as after_id for the next
+    page. limit=0 streams the whole table; format=ndjson streams one movie per line,
+    from after_id to the end unless a limit is given.
+    """
+    try:
+        selected = parse_fields(fields)
+        limit = parse_limit(limit, format == "ndjson")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if limit == 0 or format == "ndjson":
+        movies = iter_movies(selected, after_id, limit, summary_chars)
+        if format == "ndjson":
+            return StreamingResponse(json_lines(movies), media_type="application/x-ndjson")
+        return StreamingResponse(json_array(movies), media_type="application/json")
+
+    if async_engine is not None:
+        async with async_session_scope() as db:
+            data, next_after_id = await fetch_page_async(db, selected, after_id, limit, summary_chars)
+    else:
+        data, next_after_id = await run_in_threadpool(_fetch_page_blocking, selected, after_id, limit, summary_chars)
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
+    return data
 
 # ==========================================
 #              AUTH ROUTES
@@ -129,9 +253,18 @@ def refresh_token(request: RefreshRequest):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
+def _decode_token(token):
+    """jwt.decode with an in-process LRU of verified token -> claims (entries die with the token)."""
+    payload = _verified_tokens.get(token)
+    if payload is not None and payload["exp"] > time.time():
+        return payload
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    _verified_tokens.set(token, payload)
+    return payload
+
 # اندپوینت مخصوص Nginx (برای چک کردن توکن)
 @app.get("/auth/verify")
-def verify_token(authorization: str = Header(None)):
+def verify_token(response: Response, authorization: str = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="No token provided")
 
@@ -140,12 +273,16 @@ def verify_token(authorization: str = Header(None)):
         if scheme.lower() != "bearer":
             raise HTTPException(status_code=401, detail="Invalid authentication scheme")
             
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
         
         # اگر توکن Expire شده باشد، اینجا خودش به except jwt.ExpiredSignatureError می‌رود
         if payload.get("type") == "refresh":
              raise HTTPException(status_code=401, detail="Cannot use refresh token for access")
 
+        # nginx caches this answer per Authorization header; never past the token's expiry
+        max_age = min(AUTH_CACHE_MAX_AGE, int(payload["exp"] - time.time()))
+        if max_age > 0:
+            response.headers["Cache-Control"] = f"max-age={max_age}"
         return {"status": "ok", "user": payload.get("sub")}
         
     except jwt.ExpiredSignatureError:
@@ -0,0 +1,40 @@
+"""
+gunicorn settings for the Flask app (docker-compose: gunicorn -c gunicorn.conf.py app:app).
+
+The app is imported once in the master (preload_app) and the spaCy model and
+classifier index are loaded there before the workers are forked, so every
+worker shares those pages copy-on-write instead of loading its own copy.
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    import metrics
+    metrics.clear_multiproc_dir()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers are spawned
+    if not preload_app:
+        return
+    import startup
+    from celery_app import INFERENCE_MODE
+    from classifier import warm_up
+
+    if INFERENCE_MODE != "celery":
+        # In celery mode the inference workers own the model
+        try:
+            warm_up()
+        except Exception as e:
+            server.log.warning(f"Warm-up failed, workers will load on first request: {e}")
+    startup.report("flask-web master")
@@ -0,0 +1,256 @@
+"""
+Compact binary serialization of the published classifier index.
+
+Layout of a packed index (all integers little-endian):
+
+    MAGIC (8 bytes) | header length (u32) | header (JSON, utf-8) | sections...
+
+The header lists every section as [dtype, offset, length]. Sections start on a
+64-byte boundary so np.frombuffer can view them in place without copying. The
+vocabulary and titles are utf-8 blobs with offset arrays (plus the columns in
+sorted word order for lookups), so a decoded index holds no per-word or
+per-movie Python objects. Nothing is unpickled, so a tampered Redis value can at
+worst fail to decode.
+
+The same buffer is published to Redis and, when INDEX_DIR is set, written to a
+shared file that web workers mmap read-only.
+"""
+import os
+import json
+import mmap
+import struct
+import zlib
+from collections.abc import Sequence
+import numpy as np
+from sparse_index import SparseIndex
+from lsh_index import LSHIndex
+
+MAGIC = b"KNNIDX\x00\x01"
+FORMAT_VERSION = 3
+ALIGNMENT = 64
+INDEX_FILE = "classifier.idx"
+
+# Redis values are split into chunks of this size (bytes); 0 disables chunking
+INDEX_CHUNK_BYTES = int(os.getenv("INDEX_CHUNK_BYTES", str(4 * 1024 * 1024)))
+# zlib-compress chunks before they go to Redis (smaller transfer, one extra copy on load)
+INDEX_COMPRESS = os.getenv("INDEX_COMPRESS", "0") == "1"
+
+_SECTIONS = {
+    "indptr": np.int64,
+    "indices": np.int32,
+    "data": np.float32,
+    "post_ptr": np.int64,
+    "post_rows": np.int32,
+    "post_weights": np.float32,
+    "term_max": np.float32,
+    "idf": np.float32,
+    "movie_ids": np.int64,
+    "term_offsets": np.int64,
+    "term_bytes": np.uint8,
+    "term_order": np.int32,
+    "title_offsets": np.int64,
+    "title_bytes": np.uint8,
+}
+# Only written when the index carries LSH tables (header meta "lsh" holds their parameters)
+_OPTIONAL_SECTIONS = {
+    "lsh_keys": np.uint64,
+    "lsh_rows": np.int32,
+}
+
+
+class StringTable(Sequence):
+    """Read-only list of strings stored as one utf-8 blob plus offsets; decodes on access."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+class TermLookup:
+    """word -> column lookup by binary search over the columns in sorted word order."""
+
+    def __init__(self, terms, order):
+        self.terms = terms
+        self.order = order
+
+    def get(self, word, default=None):
+        key = word.encode("utf-8")
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            col = self.order[mid]
+            current = self.terms.blob[self.terms.offsets[col]:self.terms.offsets[col + 1]].tobytes()
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return int(col)
+        return default
+
+    def __len__(self):
+        return len(self.order)
+
+
+class MovieTable(Sequence):
+    """Published movies as {"id", "title"} dicts built on access from the packed tables."""
+
+    def __init__(self, ids, titles):
+        self.ids = ids
+        self.titles = titles
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, row):
+        return {"id": int(self.ids[row]), "title": self.titles[row]}
+
+
+def _string_section(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def pack_index(movie_list, index, meta=None):
+    """Serializes movies + SparseIndex (+ small JSON meta) into one bytes buffer."""
+    term_offsets, term_bytes = _string_section(index.terms)
+    title_offsets, title_bytes = _string_section([m["title"] or "" for m in movie_list])
+    # Byte-wise order of the utf-8 words, which is what TermLookup compares
+    term_order = sorted(range(len(index.terms)), key=lambda col: index.terms[col].encode("utf-8"))
+    arrays = {
+        "indptr": index.indptr,
+        "indices": index.indices,
+        "data": index.data,
+        "post_ptr": index.post_ptr,
+        "post_rows": index.post_rows,
+        "post_weights": index.post_weights,
+        "term_max": index.term_max,
+        # Indexes built without an IDF table score queries unweighted (IDF 1)
+        "idf": index.idf if index.idf is not None else np.ones(len(index.terms)),
+        "movie_ids": np.array([m["id"] for m in movie_list], dtype=np.int64),
+        "term_offsets": term_offsets,
+        "term_bytes": term_bytes,
+        "term_order": np.array(term_order, dtype=np.int32),
+        "title_offsets": title_offsets,
+        "title_bytes": title_bytes,
+    }
+
+    meta = dict(meta or {})
+    section_types = dict(_SECTIONS)
+    if index.lsh is not None:
+        arrays.update(index.lsh.arrays())
+        section_types.update(_OPTIONAL_SECTIONS)
+        meta["lsh"] = index.lsh.params()
+
+    payloads = []
+    sections = {}
+    offset = 0
+    for name, dtype in section_types.items():
+        raw = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+        offset = _align(offset)
+        sections[name] = [np.dtype(dtype).str, offset, len(raw)]
+        payloads.append((offset, raw))
+        offset += len(raw)
+
+    header = json.dumps({"format": FORMAT_VERSION, "sections": sections, "meta": meta}).encode("utf-8")
+    # Section offsets are relative to the (aligned) end of the header
+    base = _align(len(MAGIC) + 4 + len(header))
+
+    buffer = bytearray(base + offset)
+    buffer[:len(MAGIC)] = MAGIC
+    struct.pack_into("<I", buffer, len(MAGIC), len(header))
+    buffer[len(MAGIC) + 4:len(MAGIC) + 4 + len(header)] = header
+    for start, raw in payloads:
+        buffer[base + start:base + start + len(raw)] = raw
+    return bytes(buffer)
+
+
+def unpack_index(buffer):
+    """
+    Decodes a packed index. Arrays are read-only views into buffer (bytes,
+    bytearray or mmap), so buffer must stay alive as long as the index.
+    Returns (movies, index, meta) where movies is a MovieTable.
+    """
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not a packed classifier index")
+    (header_len,) = struct.unpack_from("<I", buffer, len(MAGIC))
+    header_start = len(MAGIC) + 4
+    header = json.loads(bytes(buffer[header_start:header_start + header_len]))
+    if header["format"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format {header['format']}")
+    base = _align(header_start + header_len)
+
+    arrays = {}
+    for name, (dtype, offset, length) in header["sections"].items():
+        dtype = np.dtype(dtype)
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=length // dtype.itemsize, offset=base + offset)
+
+    terms = StringTable(arrays["term_offsets"], arrays["term_bytes"])
+    movies = MovieTable(arrays["movie_ids"], StringTable(arrays["title_offsets"], arrays["title_bytes"]))
+    postings = {
+        "ptr": arrays["post_ptr"],
+        "rows": arrays["post_rows"],
+        "weights": arrays["post_weights"],
+        "max": arrays["term_max"],
+    }
+    lsh = None
+    if "lsh" in header["meta"]:
+        lsh = LSHIndex(arrays["lsh_keys"], arrays["lsh_rows"], **header["meta"]["lsh"])
+    index = SparseIndex(terms, arrays["indptr"], arrays["indices"], arrays["data"], postings,
+                        vocab=TermLookup(terms, arrays["term_order"]), idf=arrays["idf"], lsh=lsh)
+    return movies, index, header["meta"]
+
+
+def write_index_file(blob, directory):
+    """Writes the packed index next to the live file and renames it over it (atomic on POSIX)."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, INDEX_FILE)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def open_index_file(directory):
+    """mmaps the shared index file read-only; returns None if it does not exist yet."""
+    path = os.path.join(directory, INDEX_FILE)
+    try:
+        with open(path, "rb") as f:
+            # The mapping stays valid after close and after a newer file is renamed over path
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def to_chunks(blob):
+    """Splits (and optionally compresses) a packed index into Redis-sized values."""
+    size = INDEX_CHUNK_BYTES or len(blob) or 1
+    chunks = [blob[i:i + size] for i in range(0, len(blob), size)] or [b""]
+    if INDEX_COMPRESS:
+        chunks = [zlib.compress(chunk, 1) for chunk in chunks]
+    return chunks, {"format": FORMAT_VERSION, "compressed": INDEX_COMPRESS, "bytes": len(blob)}
+
+
+def from_chunks(chunks, manifest):
+    """Reassembles the buffer written by to_chunks."""
+    if manifest.get("compressed"):
+        chunks = [zlib.decompress(chunk) for chunk in chunks]
+    if len(chunks) == 1:
+        return chunks[0]
+    return b"".join(chunks)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,83 @@
+import os
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Movie
+from token_store import store_tokens
+
+# Parsed movies written per INSERT ... ON CONFLICT statement
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _dedupe(movies):
+    """Last occurrence of each (title, year) wins, first-seen order is kept."""
+    by_key = {}
+    for movie in movies:
+        by_key[(movie["title"], movie["year"])] = movie
+    return list(by_key.values())
+
+
+def upsert_movies(db, movies):
+    """
+    Writes scraped {"title", "year", "summary"} dicts keyed on (title, year):
+    new movies are inserted, movies whose summary changed are updated in place
+    and identical ones are not written at all. Tokens are stored for every
+    inserted or updated row. The caller commits.
+
+    Returns {"inserted", "updated", "unchanged", "updated_ids"}.
+    """
+    insert = _DIALECT_INSERTS[db.bind.dialect.name]
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "updated_ids": []}
+    movies = _dedupe(movies)
+
+    for start in range(0, len(movies), INGEST_BATCH_SIZE):
+        batch = movies[start:start + INGEST_BATCH_SIZE]
+        existing = {
+            (title, year): (movie_id, summary)
+            for movie_id, title, year, summary in db.query(Movie.id, Movie.title, Movie.year, Movie.summary)
+            .filter(Movie.title.in_({m["title"] for m in batch}))
+        }
+
+        rows, null_year_updates = [], []
+        for movie in batch:
+            current = existing.get((movie["title"], movie["year"]))
+            if current is None:
+                counts["inserted"] += 1
+            elif current[1] == movie["summary"]:
+                counts["unchanged"] += 1
+                continue
+            else:
+                counts["updated"] += 1
+                counts["updated_ids"].append(current[0])
+                if movie["year"] is None:
+                    # NULLs never conflict in a unique index, so these are updated by id
+                    null_year_updates.append({"id": current[0], "summary": movie["summary"]})
+                    continue
+            rows.append({"title": movie["title"], "year": movie["year"], "summary": movie["summary"], "rating": None})
+
+        if rows:
+            stmt = insert(Movie).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Movie.title, Movie.year],
+                set_={"summary": stmt.excluded.summary},
+                # A row another scrape already brought up to date is left alone
+                where=Movie.summary.is_distinct_from(stmt.excluded.summary),
+            ).returning(Movie.id)
+            changed_ids = [movie_id for (movie_id,) in db.execute(stmt)]
+        else:
+            changed_ids = []
+        for values in null_year_updates:
+            db.execute(update(Movie).where(Movie.id == values["id"]).values(summary=values["summary"]))
+            changed_ids.append(values["id"])
+
+        if changed_ids:
+            # Clean the changed summaries once here so classifier rebuilds can skip NLP.
+            # A failure only loses the tokens (rebuilds backfill them), not the movies.
+            try:
+                with db.begin_nested():
+                    store_tokens(db, db.query(Movie).filter(Movie.id.in_(changed_ids)).all())
+            except Exception as token_err:
+                print(f"[WARN] Failed to store summary tokens: {token_err}")
+
+    return counts
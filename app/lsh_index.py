@@ -0,0 +1,149 @@
+"""
+Random-projection (SimHash) LSH over the normalized TF-IDF rows of a SparseIndex.
+
+Every vocabulary column has a deterministic row of +-1 coordinates (a hash of
+seed, column and hyperplane, so nothing has to be stored to project a query).
+A movie's projection onto tables * bits hyperplanes is cut into `tables`
+signatures of `bits` sign bits; vectors with a small angle between them agree
+on most bits. Each table keeps the signatures sorted with their rows, so a
+bucket is one searchsorted range.
+
+Queries look up their own bucket in every table plus `probes` neighbouring
+buckets (the signature with one of its least certain bits flipped), and the
+union of those rows is re-scored exactly by the SparseIndex.
+
+More bits: smaller buckets (faster, lower recall). More tables / probes: more
+candidates (slower, higher recall).
+"""
+import os
+import numpy as np
+
+# Defaults trade recall for speed (benchmarks/ann_recall.py, 50k movies, k=5): ~15% of the corpus
+# as candidates, p50 ~4.3 ms vs ~9 ms for the exact scan, the exact best match kept for every query
+# but recall@5 only ~0.50 (the weaker neighbours share few words with the query). More recall costs
+# more candidates: LSH_PROBES=3 ~0.55, LSH_TABLES=40 with 3 probes ~0.73 at about the exact scan time
+LSH_TABLES = int(os.getenv("LSH_TABLES", "24"))
+LSH_BITS = int(os.getenv("LSH_BITS", "10"))
+LSH_PROBES = int(os.getenv("LSH_PROBES", "2"))
+LSH_SEED = int(os.getenv("LSH_SEED", "1"))
+# Rows projected per block while building (bounds the nnz x hyperplanes temporary)
+LSH_BUILD_BLOCK = 1024
+
+_M1 = np.uint64(0x9E3779B97F4A7C15)
+_M2 = np.uint64(0xBF58476D1CE4E5B9)
+_M3 = np.uint64(0x94D049BB133111EB)
+
+
+def projection_rows(cols, n_planes, seed):
+    """The +-1 hyperplane coordinates of the given columns, shape (len(cols), n_planes)."""
+    # splitmix64 of (column, hyperplane, seed): deterministic, vectorized, nothing stored
+    with np.errstate(over="ignore"):
+        x = np.asarray(cols, dtype=np.uint64)[:, None] * np.uint64(n_planes) + np.arange(n_planes, dtype=np.uint64)
+        x = (x ^ np.uint64(seed)) + _M1
+        x = (x ^ (x >> np.uint64(30))) * _M2
+        x = (x ^ (x >> np.uint64(27))) * _M3
+        x ^= x >> np.uint64(31)
+    return np.where(x & np.uint64(1), 1.0, -1.0).astype(np.float32)
+
+
+def _signatures(projections, tables, bits):
+    """(n, tables * bits) projections -> (tables, n) uint64 signatures."""
+    signs = (projections > 0).reshape(len(projections), tables, bits)
+    weights = np.uint64(1) << np.arange(bits, dtype=np.uint64)
+    return (signs.astype(np.uint64) * weights).sum(axis=2, dtype=np.uint64).T
+
+
+def _row_signatures(index, start, end, tables, bits, seed):
+    """(tables, end - start) signatures of rows start..end-1 of a SparseIndex."""
+    n_planes = tables * bits
+    signatures = np.zeros((tables, end - start), dtype=np.uint64)
+    for block in range(start, end, LSH_BUILD_BLOCK):
+        block_end = min(block + LSH_BUILD_BLOCK, end)
+        lo, hi = index.indptr[block], index.indptr[block_end]
+        projections = np.zeros((block_end - block, n_planes), dtype=np.float32)
+        nonempty = np.flatnonzero(np.diff(index.indptr[block:block_end + 1]))
+        if len(nonempty):
+            # Hyperplane rows of this block's columns only, not of the whole vocabulary
+            cols, inverse = np.unique(index.indices[lo:hi], return_inverse=True)
+            planes = projection_rows(cols, n_planes, seed)
+            products = index.data[lo:hi, None] * planes[inverse]
+            projections[nonempty] = np.add.reduceat(products, index.indptr[block:block_end][nonempty] - lo, axis=0)
+        signatures[:, block - start:block_end - start] = _signatures(projections, tables, bits)
+    return signatures
+
+
+class LSHIndex:
+    """Sorted SimHash tables of a SparseIndex; built with build(), queried with candidates()."""
+
+    def __init__(self, keys, rows, tables, bits, seed, probes=LSH_PROBES):
+        # keys / rows: table-major, each table's signatures sorted ascending with their rows
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+        self.probes = probes
+        n = len(keys) // tables if tables else 0
+        self.keys = np.asarray(keys, dtype=np.uint64).reshape(tables, n)
+        self.rows = np.asarray(rows, dtype=np.int32).reshape(tables, n)
+
+    @classmethod
+    def build(cls, index, tables=LSH_TABLES, bits=LSH_BITS, seed=LSH_SEED):
+        if not 1 <= bits <= 64:
+            raise ValueError("LSH_BITS must be between 1 and 64")
+        signatures = _row_signatures(index, 0, index.n_rows, tables, bits, seed)
+        order = np.argsort(signatures, axis=1, kind="stable")
+        keys = np.take_along_axis(signatures, order, axis=1)
+        return cls(keys.ravel(), order.astype(np.int32).ravel(), tables, bits, seed)
+
+    def with_rows(self, keep_rows, index):
+        """
+        The tables of index = SparseIndex.with_rows(keep_rows, vectors): kept rows
+        keep their signatures (their vectors are unchanged) under their new row
+        numbers, and only the rows appended after them are projected and merged
+        into each sorted table.
+        """
+        keep_rows = np.asarray(keep_rows, dtype=np.int64)
+        n_kept = len(keep_rows)
+        # Old row -> new row, -1 for dropped rows
+        renumber = np.full(self.rows.shape[1], -1, dtype=np.int64)
+        renumber[keep_rows] = np.arange(n_kept)
+        added = _row_signatures(index, n_kept, index.n_rows, self.tables, self.bits, self.seed)
+
+        keys, rows = [], []
+        for t in range(self.tables):
+            kept_rows = renumber[self.rows[t]]
+            kept = kept_rows >= 0
+            kept_keys = self.keys[t][kept]
+            order = np.argsort(added[t], kind="stable")
+            at = np.searchsorted(kept_keys, added[t][order], side="right")
+            keys.append(np.insert(kept_keys, at, added[t][order]))
+            rows.append(np.insert(kept_rows[kept], at, order + n_kept))
+        return LSHIndex(np.concatenate(keys), np.concatenate(rows), self.tables, self.bits, self.seed, self.probes)
+
+    def arrays(self):
+        """Sections stored by index_store.pack_index."""
+        return {"lsh_keys": self.keys.ravel(), "lsh_rows": self.rows.ravel()}
+
+    def params(self):
+        return {"tables": self.tables, "bits": self.bits, "seed": self.seed}
+
+    def candidates(self, query, probes=None):
+        """Sorted unique rows sharing a (probed) bucket with a query_vector() in any table."""
+        cols, weights = query
+        probes = self.probes if probes is None else probes
+        projection = weights.astype(np.float32) @ projection_rows(cols, self.tables * self.bits, self.seed)
+        margins = np.abs(projection).reshape(self.tables, self.bits)
+        signatures = _signatures(projection[None, :], self.tables, self.bits)[:, 0]
+
+        # High-recall settings return a large share of the corpus; a row mask unions that faster than unique()
+        found = np.zeros(self.rows.shape[1], dtype=bool)
+        for t in range(self.tables):
+            probe_keys = [signatures[t]]
+            # Flip the bits whose hyperplane the query lies closest to
+            for bit in np.argsort(margins[t])[:probes]:
+                probe_keys.append(signatures[t] ^ (np.uint64(1) << np.uint64(bit)))
+            probe_keys = np.asarray(probe_keys, dtype=np.uint64)
+            starts = np.searchsorted(self.keys[t], probe_keys, side="left")
+            ends = np.searchsorted(self.keys[t], probe_keys, side="right")
+            for s, e in zip(starts, ends):
+                found[self.rows[t, s:e]] = True
+        return np.flatnonzero(found).astype(np.int32)
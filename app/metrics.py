@@ -0,0 +1,157 @@
+"""
+Prometheus metrics shared by the web apps and the Celery workers.
+
+Histograms are recorded where the work happens (stage timings via timed());
+the counters the app already keeps (result cache, DB pool, inference pool,
+startup) are read when /metrics is scraped through register_stats().
+
+Processes forked by gunicorn, the inference pool or Celery prefork only
+share their histograms when PROMETHEUS_MULTIPROC_DIR is set (one value file
+per process, summed on scrape). register_stats() sources always describe
+the process serving /metrics.
+"""
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Directory for per-process metric files; must be set before prometheus_client is imported
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    REGISTRY, CollectorRegistry, Histogram, generate_latest, start_http_server, CONTENT_TYPE_LATEST,
+)
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily  # noqa: E402
+
+# Celery workers serve /metrics on this port (0 = off); the web apps use their own /metrics route
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+PREFIX = "imdb"
+# Sub-millisecond scoring up to minutes-long builds and browser scrapes
+BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    f"{PREFIX}_stage_seconds", "Time spent in each stage of an operation",
+    ["operation", "stage"], buckets=BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    f"{PREFIX}_http_request_seconds", "Request handling time (until the response starts)",
+    ["app", "method", "route", "status"], buckets=BUCKETS,
+)
+TASK_SECONDS = Histogram(
+    f"{PREFIX}_celery_task_seconds", "Celery task run time", ["task", "state"], buckets=BUCKETS,
+)
+SCRAPE_PAGE_SECONDS = Histogram(
+    f"{PREFIX}_scrape_page_seconds", "Fetch + parse time of one listing page", ["fetcher"], buckets=BUCKETS,
+)
+SCRAPE_BLOCK_SECONDS = Histogram(
+    f"{PREFIX}_scrape_block_seconds", "Parse time of one movie block",
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025),
+)
+
+# name -> (stats callable, counter keys, label name)
+_stats_sources = {}
+
+
+@lru_cache(maxsize=None)
+def _stage(operation, stage):
+    # labels() resolves the child under a lock on every call; stage names are a fixed set
+    return STAGE_SECONDS.labels(operation, stage)
+
+
+@contextmanager
+def timed(operation, stage):
+    """Observes the block's duration in STAGE_SECONDS."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage(operation, stage).observe(time.perf_counter() - start)
+
+
+def register_stats(name, fn, counters=(), label=None):
+    """
+    Exposes the numeric values of the dict returned by fn() on every scrape:
+    as {PREFIX}_{name}_{key} (counters for keys in `counters`, gauges otherwise),
+    or, with label, as one gauge {PREFIX}_{name} with a {label}=key label.
+    """
+    _stats_sources[name] = (fn, frozenset(counters), label)
+
+
+class _StatsCollector:
+    def collect(self):
+        for name, (fn, counters, label) in list(_stats_sources.items()):
+            try:
+                stats = fn()
+            except Exception as e:
+                print(f"[METRICS] Stats source {name} failed: {e}")
+                continue
+            values = {key: value for key, value in stats.items()
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)}
+            if label:
+                family = GaugeMetricFamily(f"{PREFIX}_{name}", f"{name} by {label}", labels=[label])
+                for key, value in values.items():
+                    family.add_metric([str(key)], value)
+                yield family
+                continue
+            for key, value in values.items():
+                metric = f"{PREFIX}_{name}_{key}"
+                if key in counters:
+                    yield CounterMetricFamily(metric, f"{name} {key}", value=value)
+                else:
+                    yield GaugeMetricFamily(metric, f"{name} {key}", value=value)
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def _registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_stats_collector)
+    return registry
+
+
+def render():
+    """(body, content type) of the /metrics response."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def serve(port=METRICS_PORT):
+    """Starts a /metrics HTTP server in a background thread (Celery workers)."""
+    if port:
+        start_http_server(port, registry=_registry())
+        print(f"[METRICS] Serving /metrics on port {port}")
+
+
+def clear_multiproc_dir(keep_own=True):
+    """
+    Drops value files left by a previous run. Call it once before the worker
+    processes start (never from a worker, it would delete its siblings' files):
+    gunicorn on_starting, Celery worker_init, `python metrics.py` for uvicorn.
+    """
+    if not MULTIPROC_DIR:
+        return
+    own = f"_{os.getpid()}.db" if keep_own else None
+    for name in os.listdir(MULTIPROC_DIR):
+        if name.endswith(".db") and not (own and name.endswith(own)):
+            os.remove(os.path.join(MULTIPROC_DIR, name))
+
+
+def mark_process_dead(pid):
+    """Lets live gauges of an exited worker be dropped (gunicorn child_exit)."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+
+if __name__ == "__main__":
+    # The launcher exits right away, so its own (empty) files go too
+    clear_multiproc_dir(keep_own=False)
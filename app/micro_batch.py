@@ -0,0 +1,67 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# A batch is scored as soon as it holds this many requests...
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "32"))
+# ...or once the oldest request has waited this long
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "10"))
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and hands them to fn as one list.
+    fn(items) must return one result per item (in order) or a single dict with
+    an "error" key, which is then returned to every caller of the batch.
+    The collector thread starts on first use, so it is created in the worker
+    process and not in a parent that forks later.
+    """
+
+    def __init__(self, fn, max_size=INFERENCE_BATCH_SIZE, max_wait_ms=INFERENCE_BATCH_WAIT_MS):
+        self.fn = fn
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """Queues item; returns a Future resolved with its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        try:
+            results = self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        if isinstance(results, dict):
+            results = [results] * len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, Index
 from database import Base
 
 class Movie(Base):
@@ -9,3 +9,18 @@ class Movie(Base):
     summary = Column(String)
     rating = Column(Float)
     year = Column(Integer)
+
+    # Natural key used by ingest.upsert_movies (ON CONFLICT (title, year))
+    __table_args__ = (Index("uq_movies_title_year", "title", "year", unique=True),)
+
+class MovieTokens(Base):
+    """Cleaned summary of a movie, computed once at ingest time so rebuilds skip NLP."""
+    __tablename__ = "movie_tokens"
+
+    movie_id = Column(Integer, ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+    # sha256 of the raw summary the tokens were computed from
+    summary_hash = Column(String(64), nullable=False)
+    # text_cleaning backend used ("spacy" / "fast")
+    backend = Column(String(16), nullable=False)
+    # Space-separated cleaned words, i.e. cleaning(summary)
+    tokens = Column(Text, nullable=False)
@@ -0,0 +1,101 @@
+import os
+import json
+from sqlalchemy import String, select, func, case
+from database import session_scope
+from models import Movie
+
+MOVIE_FIELDS = ("id", "title", "year", "rating", "summary")
+DEFAULT_FIELDS = ("id", "title", "year", "summary")
+MOVIES_PAGE_SIZE = int(os.getenv("MOVIES_PAGE_SIZE", "100"))
+MOVIES_MAX_PAGE_SIZE = int(os.getenv("MOVIES_MAX_PAGE_SIZE", "1000"))
+# Rows fetched per round trip when streaming (server-side cursor on PostgreSQL)
+MOVIES_STREAM_BATCH = int(os.getenv("MOVIES_STREAM_BATCH", "500"))
+SUMMARY_CHARS = 100
+
+
+def parse_fields(raw):
+    """"id,title" -> ("id", "title"); raises ValueError on unknown names."""
+    if not raw:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(",") if name.strip()))
+    unknown = [name for name in fields if name not in MOVIE_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields {unknown}. Use any of {', '.join(MOVIE_FIELDS)}.")
+    return fields
+
+
+def parse_limit(raw, ndjson=False):
+    """
+    None -> MOVIES_PAGE_SIZE, or 0 for NDJSON (a line stream has no page cursor);
+    0 lists everything (streamed); capped at MOVIES_MAX_PAGE_SIZE.
+    """
+    if raw is None:
+        return 0 if ndjson else MOVIES_PAGE_SIZE
+    limit = int(raw)
+    if limit < 0:
+        raise ValueError("limit must be >= 0")
+    return min(limit, MOVIES_MAX_PAGE_SIZE) if limit else 0
+
+
+def _summary_column(summary_chars):
+    if not summary_chars:
+        return Movie.summary
+    # Truncated by the database, so full summaries never leave it
+    truncated = func.substr(Movie.summary, 1, summary_chars, type_=String) + "..."
+    return case((func.length(Movie.summary) > summary_chars, truncated), else_=Movie.summary)
+
+
+def movies_query(fields, after_id=0, limit=0, summary_chars=SUMMARY_CHARS):
+    """Keyset page: the requested columns of movies with id > after_id, by id."""
+    columns = [Movie.id.label("id")]
+    for name in fields:
+        if name == "summary":
+            columns.append(_summary_column(summary_chars).label("summary"))
+        elif name != "id":
+            columns.append(getattr(Movie, name).label(name))
+    query = select(*columns).where(Movie.id > after_id).order_by(Movie.id)
+    return query.limit(limit) if limit else query
+
+
+def fetch_page(db, fields, after_id=0, limit=MOVIES_PAGE_SIZE, summary_chars=SUMMARY_CHARS):
+    """Returns (rows, next_after_id); next_after_id is None on the last page."""
+    rows = db.execute(movies_query(fields, after_id, limit, summary_chars)).all()
+    items = [{name: getattr(row, name) for name in fields} for row in rows]
+    next_after_id = rows[-1].id if rows and len(rows) == limit else None
+    return items, next_after_id
+
+
+async def fetch_page_async(db, fields, after_id=0, limit=MOVIES_PAGE_SIZE, summary_chars=SUMMARY_CHARS):
+    """fetch_page on an AsyncSession (DB_ASYNC=1)."""
+    rows = (await db.execute(movies_query(fields, after_id, limit, summary_chars))).all()
+    items = [{name: getattr(row, name) for name in fields} for row in rows]
+    next_after_id = rows[-1].id if rows and len(rows) == limit else None
+    return items, next_after_id
+
+
+def iter_movies(fields, after_id=0, limit=0, summary_chars=SUMMARY_CHARS):
+    """
+    Yields movie dicts MOVIES_STREAM_BATCH rows at a time, with its own
+    session so it can outlive the request handler (streaming responses).
+    """
+    with session_scope() as db:
+        result = db.execute(
+            movies_query(fields, after_id, limit, summary_chars),
+            execution_options={"yield_per": MOVIES_STREAM_BATCH},
+        )
+        for row in result:
+            yield {name: getattr(row, name) for name in fields}
+
+
+def json_lines(movies):
+    """NDJSON body: one movie per line."""
+    for movie in movies:
+        yield json.dumps(movie) + "\n"
+
+
+def json_array(movies):
+    """A JSON array written element by element."""
+    yield "["
+    for i, movie in enumerate(movies):
+        yield ("," if i else "") + json.dumps(movie)
+    yield "]"
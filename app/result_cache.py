@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict, Counter
+
+# In-process LRU (per web/worker process)
+PREDICT_CACHE_SIZE = int(os.getenv("PREDICT_CACHE_SIZE", "1024"))
+PREDICT_CACHE_TTL = float(os.getenv("PREDICT_CACHE_TTL", "300"))
+# Shared Redis level (0 disables it)
+PREDICT_REDIS_CACHE_TTL = int(os.getenv("PREDICT_REDIS_CACHE_TTL", "3600"))
+REDIS_PREFIX = "predict_cache"
+
+
+class LRUCache:
+    """Thread-safe LRU with a per-entry time to live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResultCache:
+    """
+    Two-level cache for /predict results: an in-process LRU in front of a shared
+    Redis cache. Keys embed the index version, so a newly published index never
+    serves old results and stale Redis entries simply expire.
+    """
+
+    def __init__(self, redis_client=None):
+        self.local = LRUCache(PREDICT_CACHE_SIZE, PREDICT_CACHE_TTL)
+        self.redis = redis_client
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(tokens, k, mode, version):
+        """Cleaned-token multiset + k + retrieval mode + index version, hashed."""
+        payload = json.dumps([sorted(Counter(tokens).items()), k, mode, int(version)])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+
+        if self.redis is not None and PREDICT_REDIS_CACHE_TTL > 0:
+            try:
+                cached = self.redis.get(f"{REDIS_PREFIX}:{key}")
+            except Exception as e:
+                print(f"[CACHE] Redis lookup failed: {e}")
+                cached = None
+            if cached is not None:
+                value = json.loads(cached)
+                self.local.set(key, value)
+                self._count("redis_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.redis is not None and PREDICT_REDIS_CACHE_TTL > 0:
+            try:
+                self.redis.setex(f"{REDIS_PREFIX}:{key}", PREDICT_REDIS_CACHE_TTL, json.dumps(value))
+            except Exception as e:
+                print(f"[CACHE] Redis store failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = sum(counts.get(name, 0) for name in ("local_hits", "redis_hits", "misses"))
+        hits = counts.get("local_hits", 0) + counts.get("redis_hits", 0)
+        return {
+            "local_hits": counts.get("local_hits", 0),
+            "redis_hits": counts.get("redis_hits", 0),
+            "misses": counts.get("misses", 0),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "local_size": len(self.local),
+            "local_maxsize": self.local.maxsize,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
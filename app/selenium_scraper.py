@@ -1,12 +1,24 @@
 import os
-import time
 import re
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 
-from database import SessionLocal
-from models import Movie
+from database import session_scope
+from ingest import upsert_movies
+from metrics import timed, SCRAPE_PAGE_SECONDS, SCRAPE_BLOCK_SECONDS
 
 # -----------------------------
 # CONFIGURATION
@@ -17,6 +29,41 @@ BASE_URL = "https://critics.com/thisyear/"
 # Selenium host is retrieved from the environment for Docker compatibility
 SELENIUM_HOST = os.getenv("SELENIUM_HOST", "localhost")
 
+# Listing pages scraped per run; each one is a separate shard / browser session
+SCRAPE_PAGES = int(os.getenv("SCRAPE_PAGES", "1"))
+# Explicit comma-separated page list, overrides BASE_URL + SCRAPE_PAGES
+SCRAPE_URLS = os.getenv("SCRAPE_URLS", "")
+# Browser sessions open at once across all workers (match the Selenium grid size)
+SELENIUM_MAX_SESSIONS = int(os.getenv("SELENIUM_MAX_SESSIONS", "1"))
+# Longest wait for the movie list to appear before a page counts as empty
+SELENIUM_WAIT_SECONDS = float(os.getenv("SELENIUM_WAIT_SECONDS", "15"))
+# Don't download images, stylesheets and fonts (nothing we parse depends on them)
+SELENIUM_BLOCK_RESOURCES = os.getenv("SELENIUM_BLOCK_RESOURCES", "1") == "1"
+
+# "auto": plain HTTP first, the browser only when that finds no movie blocks
+# "http" / "selenium": one backend only; "file": read saved HTML (paths or file:// URLs)
+SCRAPE_FETCHER = os.getenv("SCRAPE_FETCHER", "auto")
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+# Pages whose body + ETag/Last-Modified are kept per process for conditional GETs
+HTTP_CACHE_PAGES = int(os.getenv("HTTP_CACHE_PAGES", "256"))
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+MOVIE_BLOCK_SELECTOR = "div.et_pb_blurb_description"
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+]
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
 def get_driver():
     """Sets up the driver to work with the Selenium container."""
     chrome_options = Options()
@@ -27,85 +74,240 @@ def get_driver():
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--window-size=1920,1080")
+
+    # Return from driver.get() at DOMContentLoaded; WebDriverWait covers the rest
+    chrome_options.page_load_strategy = "eager"
+    if SELENIUM_BLOCK_RESOURCES:
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+        })
     
     # Standard User-Agent to avoid immediate bot detection
-    chrome_options.add_argument(
-        "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/120.0.0.0 Safari/537.36"
-    )
+    chrome_options.add_argument(f"user-agent={USER_AGENT}")
 
     # Connect to the remote selenium service defined in docker-compose
+    # (Chrome's connection class, so CDP commands are available on the grid)
     driver = webdriver.Remote(
-        command_executor=f"http://{SELENIUM_HOST}:4444/wd/hub",
+        command_executor=ChromeRemoteConnection(f"http://{SELENIUM_HOST}:4444/wd/hub"),
         options=chrome_options
     )
+
+    if SELENIUM_BLOCK_RESOURCES:
+        # Fonts have no content setting; CDP URL blocking covers every resource type
+        try:
+            driver.execute("executeCdpCommand", {"cmd": "Network.enable", "params": {}})
+            driver.execute("executeCdpCommand", {
+                "cmd": "Network.setBlockedURLs", "params": {"urls": BLOCKED_URL_PATTERNS},
+            })
+        except Exception as cdp_err:
+            print(f"[WARN] CDP resource blocking unavailable: {cdp_err}")
     return driver
 
-def scrape_top_movies(limit):
+def page_urls():
     """
-    Main scraping function using the new 'et_pb_blurb' logic.
-    Saves results to the database defined in models.py.
+    Listing pages to scrape, one per shard: SCRAPE_URLS (comma separated) if set,
+    otherwise BASE_URL followed by BASE_URL/page/2/ ... up to SCRAPE_PAGES.
     """
-    print(f"[INFO] Starting Scrape: {BASE_URL} (limit={limit})")
-    
-    driver = get_driver()
-    db = SessionLocal() # Open DB session
-    count = 0
+    if SCRAPE_URLS:
+        return [url.strip() for url in SCRAPE_URLS.split(",") if url.strip()]
+    return [BASE_URL] + [f"{BASE_URL}page/{n}/" for n in range(2, SCRAPE_PAGES + 1)]
+
+_http = {"session": None, "pid": None, "pages": OrderedDict()}
+_http_lock = threading.Lock()
+
+def _http_session():
+    """One keep-alive Session per process (a forked child must not reuse the parent's sockets)."""
+    with _http_lock:
+        if _http["session"] is None or _http["pid"] != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"User-Agent": USER_AGENT, "Accept-Language": "en-US,en;q=0.9"})
+            _http.update(session=session, pid=os.getpid(), pages=OrderedDict())
+        return _http["session"]
+
+def fetch_http(url):
+    """
+    GETs url over the pooled session. A page fetched before is revalidated with
+    If-None-Match / If-Modified-Since and its cached body reused on 304.
+    Returns the HTML, or None on any HTTP or network error.
+    """
+    session = _http_session()
+    cached = _http["pages"].get(url)
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
 
     try:
-        driver.get(BASE_URL)
-        time.sleep(3) # Wait for page load as per your logic
-
-        # Find all movie blocks using the description selector
-        movie_blocks = driver.find_elements(By.CSS_SELECTOR, "div.et_pb_blurb_description")
-        print(f"[INFO] Found {len(movie_blocks)} movies in the list.")
-
-        for block in movie_blocks:
-            if count >= limit:
-                break
-
-            try:
-                # 1. Extract Title and Year from the bolded paragraph
-                title_p = block.find_element(By.CSS_SELECTOR, 'p[style*="font-weight: 600"]')
-                name = title_p.find_element(By.TAG_NAME, "a").text.strip()
-                
-                # Extract and clean Year. 
-                # Note: models.py expects an Integer for year.
-                raw_year_text = title_p.text.split("|")[-1].strip()
-                year_match = re.search(r"\d{4}", raw_year_text)
-                year_int = int(year_match.group(0)) if year_match else None
-
-                # 2. Extract Summary from the paragraph with specific margins
-                summary_p = block.find_element(By.CSS_SELECTOR, 'p[style*="margin: 0px 15px 20px 15px"]')
-                summary = summary_p.text.strip()
-
-                # 3. Create and add the Movie object to session
-                new_movie = Movie(
-                    title=name,
-                    summary=summary,
-                    year=year_int,
-                    rating=None # Rating not found in current block logic
-                )
-                db.add(new_movie)
-                
-                count += 1
-                print(f"[{count}] Scraped: {name} ({year_int})")
-
-            except Exception as block_err:
-                print(f"[WARN] Failed to parse block: {block_err}")
-                continue
-
-        # Commit changes to the PostgreSQL database
-        db.commit()
-        print(f"[SUCCESS] Scraped and saved {count} movies.")
+        response = session.get(url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
+    except requests.RequestException as e:
+        print(f"[WARN] HTTP fetch failed for {url}: {e}")
+        return None
+
+    if response.status_code == 304 and cached:
+        _http["pages"].move_to_end(url)
+        return cached["html"]
+    if response.status_code != 200:
+        print(f"[WARN] HTTP {response.status_code} for {url}")
+        return None
+
+    html = response.text
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    if etag or last_modified:
+        with _http_lock:
+            _http["pages"][url] = {"etag": etag, "last_modified": last_modified, "html": html}
+            _http["pages"].move_to_end(url)
+            while len(_http["pages"]) > HTTP_CACHE_PAGES:
+                _http["pages"].popitem(last=False)
+    return html
+
+def fetch_file(url):
+    """Reads a saved page from a local path or file:// URL (offline runs and parser fixtures)."""
+    parsed = urlparse(url)
+    path = url2pathname(parsed.path) if parsed.scheme == "file" else url
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def _text(element):
+    # Whitespace-collapsed like WebElement.text
+    return " ".join(element.get_text().split())
+
+def parse_movie_blocks(html):
+    """
+    Parses a listing page with the 'et_pb_blurb' layout into
+    [{"title", "year", "summary"}], in page order. Blocks that don't match the
+    layout are skipped.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    movies = []
+
+    for block in soup.select(MOVIE_BLOCK_SELECTOR):
+        started = time.perf_counter()
+        # 1. Extract Title and Year from the bolded paragraph
+        title_p = block.select_one('p[style*="font-weight: 600"]')
+        link = title_p.find("a") if title_p else None
+        # 2. Extract Summary from the paragraph with specific margins
+        summary_p = block.select_one('p[style*="margin: 0px 15px 20px 15px"]')
+        if link is None or summary_p is None:
+            print("[WARN] Failed to parse block: missing title or summary")
+            continue
+
+        # Extract and clean Year. 
+        # Note: models.py expects an Integer for year.
+        raw_year_text = _text(title_p).split("|")[-1].strip()
+        year_match = re.search(r"\d{4}", raw_year_text)
+        year_int = int(year_match.group(0)) if year_match else None
+
+        movies.append({"title": _text(link), "year": year_int, "summary": _text(summary_p)})
+        SCRAPE_BLOCK_SECONDS.observe(time.perf_counter() - started)
 
+    return movies
+
+def scrape_page_fast(url):
+    """
+    Scrapes one listing page without a browser (saved file or plain HTTP,
+    per SCRAPE_FETCHER). Returns the movies, or None when the page has to
+    go through scrape_page_browser instead.
+    """
+    if SCRAPE_FETCHER == "selenium":
+        return None
+    started = time.perf_counter()
+    if SCRAPE_FETCHER == "file" or urlparse(url).scheme in ("", "file"):
+        with timed("scrape", "fetch_file"):
+            html = fetch_file(url)
+        with timed("scrape", "parse"):
+            movies = parse_movie_blocks(html)
+        SCRAPE_PAGE_SECONDS.labels("file").observe(time.perf_counter() - started)
+        return movies
+
+    with timed("scrape", "fetch_http"):
+        html = fetch_http(url)
+    with timed("scrape", "parse"):
+        movies = parse_movie_blocks(html) if html else []
+    SCRAPE_PAGE_SECONDS.labels("http").observe(time.perf_counter() - started)
+    if movies or SCRAPE_FETCHER == "http":
+        print(f"[INFO] Found {len(movies)} movies on {url} (http).")
+        return movies
+    print(f"[INFO] No movie blocks over plain HTTP for {url}, falling back to Selenium.")
+    return None
+
+def scrape_page(url):
+    """Scrapes one listing page, with the browser only as a fallback. Nothing is saved."""
+    movies = scrape_page_fast(url)
+    return movies if movies is not None else scrape_page_browser(url)
+
+def scrape_page_browser(url):
+    """
+    Scrapes one listing page in its own browser session: waits until the
+    movie blocks are in the DOM, then parses page_source once. Returns
+    parse_movie_blocks() output; nothing is saved.
+    """
+    print(f"[INFO] Scraping page: {url}")
+    started = time.perf_counter()
+    with timed("scrape", "browser_start"):
+        driver = get_driver()
+    movies = []
+
+    try:
+        with timed("scrape", "browser_load"):
+            driver.get(url)
+            WebDriverWait(driver, SELENIUM_WAIT_SECONDS).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, MOVIE_BLOCK_SELECTOR))
+            )
+        with timed("scrape", "parse"):
+            movies = parse_movie_blocks(driver.page_source)
+        print(f"[INFO] Found {len(movies)} movies on {url}.")
+
+    except TimeoutException:
+        print(f"[WARN] No movie list on {url} after {SELENIUM_WAIT_SECONDS}s.")
     except Exception as e:
-        print(f"[ERROR] Critical scraper failure: {e}")
+        print(f"[ERROR] Failed to scrape {url}: {e}")
     finally:
-        db.close()
         driver.quit()
-        print("[INFO] Scraper session closed.")
+        SCRAPE_PAGE_SECONDS.labels("browser").observe(time.perf_counter() - started)
+
+    return movies
+
+def save_movies(movies):
+    """
+    Upserts scraped movie dicts into the database defined in models.py,
+    together with their summary tokens. Returns the upsert_movies() counts.
+    """
+    try:
+        with session_scope() as db, timed("scrape", "save"): # Open DB session
+            counts = upsert_movies(db, movies)
+
+            # Commit changes to the PostgreSQL database
+            db.commit()
+        print(f"[SUCCESS] Scraped {len(movies)} movies: {counts['inserted']} new, "
+              f"{counts['updated']} updated, {counts['unchanged']} unchanged.")
+        return counts
+
+    except Exception as e:
+        # Raised so the task fails visibly instead of reporting an empty scrape
+        print(f"[ERROR] Critical scraper failure: {e}")
+        raise
+
+def scrape_top_movies(limit):
+    """
+    Serial scrape of every page_urls() page in one process (the Celery task
+    shards the same work across browser sessions). Stops at limit movies.
+    """
+    print(f"[INFO] Starting Scrape: {BASE_URL} (limit={limit})")
+    movies = []
+    for url in page_urls():
+        if len(movies) >= limit:
+            break
+        movies.extend(scrape_page(url))
+    counts = save_movies(movies[:limit])
+    print("[INFO] Scraper session closed.")
+    return counts
 
 if __name__ == "__main__":
     # Local debug entry point
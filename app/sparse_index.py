@@ -0,0 +1,346 @@
+import math
+import threading
+import numpy as np
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+RETRIEVAL_MODES = ("matrix", "inverted", "ann")
+
+
+class SparseIndex:
+    """
+    Movie TF-IDF vectors stored as one L2-normalized CSR matrix.
+    Row i is movie i, columns are vocabulary terms.
+
+    The transpose (term -> posting list of rows and weights) is kept as an
+    inverted index so short queries can be scored from their postings only.
+
+    idf holds the IDF weight of every column, applied to queries so they are
+    weighted like the stored vectors (None = queries are used as given).
+
+    Weights are stored as float32. Arrays that already have the right dtype are
+    used as-is, so an index decoded with np.frombuffer is not copied.
+
+    lsh is an optional lsh_index.LSHIndex over the rows, used by the "ann" mode.
+    """
+
+    def __init__(self, terms, indptr, indices, data, postings=None, vocab=None, idf=None, lsh=None):
+        # terms / vocab may be buffer-backed tables (see index_store) instead of list / dict
+        self.terms = terms if vocab is not None else list(terms)
+        self.vocab = vocab if vocab is not None else {word: col for col, word in enumerate(self.terms)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float32)
+        self.n_rows = len(self.indptr) - 1
+        # Rows with at least one stored value, the segments of the mat-vec reduction
+        self.nonempty_rows = np.flatnonzero(np.diff(self.indptr))
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float32)
+        self.lsh = lsh
+        # Per-thread scratch buffers (see _score_buffers) and the lazily built scipy postings matrix
+        self._local = threading.local()
+        self._postings_csr = None
+
+        if postings is None:
+            postings = self._build_postings()
+        self.post_ptr = np.asarray(postings["ptr"], dtype=np.int64)
+        self.post_rows = np.asarray(postings["rows"], dtype=np.int32)
+        self.post_weights = np.asarray(postings["weights"], dtype=np.float32)
+        # Largest weight in each posting list, the per-term score upper bound for MaxScore
+        self.term_max = np.asarray(postings["max"], dtype=np.float32)
+
+    def _build_postings(self):
+        """Transposes the CSR matrix; rows inside each posting list stay sorted."""
+        row_ids = np.repeat(np.arange(self.n_rows, dtype=np.int32), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        counts = np.bincount(self.indices, minlength=len(self.terms))
+        ptr = np.concatenate([[0], np.cumsum(counts)])
+        weights = self.data[order]
+        term_max = np.zeros(len(self.terms), dtype=np.float32)
+        np.maximum.at(term_max, self.indices, self.data)
+        return {"ptr": ptr, "rows": row_ids[order], "weights": weights, "max": term_max}
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        """Builds the matrix from a list of {word: weight} dicts (one per movie)."""
+        vocab = {}
+        indptr, indices, data = encode_rows(vectors, vocab)
+        return cls(vocab.keys(), indptr, indices, data)
+
+    def with_rows(self, keep_rows, vectors, idf=None):
+        """
+        Returns a new index made of the kept rows (in the given order) followed by
+        the new {word: weight} vectors. Unknown words extend the vocabulary (their
+        IDF is taken from the idf mapping); only the new vectors are encoded and
+        normalized.
+        """
+        keep_rows = np.asarray(keep_rows, dtype=np.int64)
+        starts = self.indptr[keep_rows]
+        lengths = self.indptr[keep_rows + 1] - starts
+        kept_ptr = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.repeat(starts - kept_ptr[:-1], lengths) + np.arange(kept_ptr[-1])
+
+        vocab = {word: col for col, word in enumerate(self.terms)}
+        new_ptr, new_indices, new_data = encode_rows(vectors, vocab)
+        indptr = np.concatenate([kept_ptr, kept_ptr[-1] + new_ptr[1:]])
+        indices = np.concatenate([self.indices[positions], new_indices])
+        data = np.concatenate([self.data[positions], new_data])
+
+        new_idf = None
+        if self.idf is not None:
+            terms = list(vocab)
+            added = [idf[word] for word in terms[len(self.idf):]]
+            new_idf = np.concatenate([self.idf, np.asarray(added, dtype=np.float32)])
+        return SparseIndex(vocab.keys(), indptr, indices, data, idf=new_idf)
+
+    def row_terms(self, row):
+        """Distinct words of one movie (every stored weight is non-zero)."""
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return [self.terms[col] for col in self.indices[start:end]]
+
+    def query_vector(self, tf):
+        """
+        Turns a {word: tf} query into (cols, weights): TF-IDF weighted with the
+        index IDF table and L2-normalized once, so scoring is a plain dot product
+        against the pre-normalized rows. Unknown words get the IDF of a word no
+        movie contains (as in classifier.compute_idf) and only count toward the norm.
+        """
+        unseen_idf = math.log(max(self.n_rows, 1)) + 1
+        cols = []
+        weights = []
+        norm_sq = 0.0
+        for word, value in tf.items():
+            col = self.vocab.get(word)
+            if self.idf is not None:
+                value *= float(self.idf[col]) if col is not None else unseen_idf
+            norm_sq += value ** 2
+            if col is not None:
+                cols.append(col)
+                weights.append(value)
+
+        weights = np.asarray(weights, dtype=np.float64)
+        if norm_sq:
+            weights /= math.sqrt(norm_sq)
+        return np.asarray(cols, dtype=np.int64), weights
+
+    def scores(self, query):
+        """Cosine similarity of every movie against a query_vector()."""
+        cols, weights = query
+        scores = np.zeros(self.n_rows)
+        if not len(cols) or not self.n_rows:
+            return scores
+
+        dense = np.zeros(len(self.terms))
+        dense[cols] = weights
+        products = self.data * dense[self.indices]
+        if len(self.nonempty_rows):
+            # Empty rows own no values, so each segment runs to the next non-empty row start
+            scores[self.nonempty_rows] = np.add.reduceat(products, self.indptr[self.nonempty_rows])
+        return scores
+
+    def top_k(self, query, k=5):
+        """Returns [(row, similarity)] sorted like classifier.knn (ties keep row order)."""
+        return top_k_rows(self.scores(query), k)
+
+    def top_k_batch(self, queries, ks):
+        """
+        top_k for several query_vector()s (with their own k). With scipy this is one
+        sparse product of the batch with the posting lists (a term x movie CSR
+        matrix), so only the postings of the batch's terms are read and no
+        n_movies x batch dense matrix is built; without it each query is scored
+        on its own.
+        """
+        if sparse is None:
+            return [self.top_k(query, k) for query, k in zip(queries, ks)]
+        products = self._query_matrix(queries) @ self._postings_matrix()
+        products.sort_indices()
+        results = []
+        for j, k in enumerate(ks):
+            start, end = products.indptr[j], products.indptr[j + 1]
+            rows = products.indices[start:end]
+            found = [(int(rows[i]), sim) for i, sim in top_k_rows(products.data[start:end], k)]
+            results.append(pad_zero_rows(found, k, self.n_rows))
+        return results
+
+    def _query_matrix(self, queries):
+        indptr = np.concatenate([[0], np.cumsum([len(cols) for cols, _ in queries])])
+        indices = np.concatenate([cols for cols, _ in queries]) if len(queries) else np.empty(0, dtype=np.int64)
+        data = np.concatenate([weights for _, weights in queries]) if len(queries) else np.empty(0)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(queries), len(self.terms)))
+
+    def _postings_matrix(self):
+        """The posting lists as a scipy CSR matrix (the transpose of the index), built once."""
+        if self._postings_csr is None:
+            self._postings_csr = sparse.csr_matrix(
+                (self.post_weights, self.post_rows, self.post_ptr), shape=(len(self.terms), self.n_rows))
+        return self._postings_csr
+
+    def top_k_inverted(self, query, k=5, early_termination=True):
+        """
+        Same result as top_k, but only touches the posting lists of the query terms:
+        their weights are scatter-added into a dense per-row score buffer, so the
+        cost follows the total posting-list length, not the number of movies.
+
+        Terms are processed by decreasing score upper bound (query weight times the
+        largest weight in the posting list). With early_termination, once the current
+        k-th best partial score beats everything the remaining terms could add to an
+        unseen movie, no new candidates are admitted and the rest of the postings only
+        complete the scores of existing candidates (MaxScore), which keeps the final
+        selection small.
+        """
+        query = sorted(zip(*query), key=lambda t: t[1] * self.term_max[t[0]], reverse=True)
+        upper = [w * self.term_max[col] for col, w in query]
+        remaining = np.cumsum(upper[::-1])[::-1]
+
+        scores, seen = self._score_buffers()
+        admitted = []
+        n_candidates = 0
+        best = 0.0
+        closed = False
+        try:
+            for i, (col, weight) in enumerate(query):
+                start, end = self.post_ptr[col], self.post_ptr[col + 1]
+                rows = self.post_rows[start:end]
+                contrib = self.post_weights[start:end] * np.float64(weight)
+
+                # The k-th best score is at most the best one, so only look it up when it can matter
+                if early_termination and not closed and n_candidates >= k > 0 and best > remaining[i]:
+                    candidates = np.concatenate(admitted)
+                    kth = np.partition(scores[candidates], n_candidates - k)[n_candidates - k]
+                    closed = kth > remaining[i]
+                if closed:
+                    hit = seen[rows]
+                    scores[rows[hit]] += contrib[hit]
+                    continue
+
+                # A row appears once per posting list, so plain fancy-index += is a scatter-add
+                new = rows[~seen[rows]]
+                seen[new] = True
+                admitted.append(new)
+                n_candidates += len(new)
+                scores[rows] += contrib
+                if len(rows):
+                    best = max(best, float(scores[rows].max()))
+
+            candidates = np.sort(np.concatenate(admitted)) if admitted else np.empty(0, dtype=np.int32)
+            results = [(int(candidates[i]), sim) for i, sim in top_k_rows(scores[candidates], k)]
+        finally:
+            # Only the touched rows are reset, so the buffers are never re-zeroed in full
+            for rows in admitted:
+                scores[rows] = 0.0
+                seen[rows] = False
+
+        return pad_zero_rows(results, k, self.n_rows)
+
+    def _score_buffers(self):
+        """Per-thread dense score / seen buffers of top_k_inverted, all zero between queries."""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = (np.zeros(self.n_rows), np.zeros(self.n_rows, dtype=bool))
+        return buffers
+
+    def scores_rows(self, query, rows):
+        """Cosine similarity of the given (sorted) rows only against a query_vector()."""
+        cols, weights = query
+        dense = np.zeros(len(self.terms))
+        dense[cols] = weights
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        products = self.data[positions] * dense[self.indices[positions]]
+        return np.bincount(np.repeat(np.arange(len(rows)), lengths), weights=products, minlength=len(rows))
+
+    def top_k_ann(self, query, k=5, probes=None):
+        """
+        Approximate top_k: exact scores for the rows the LSH tables return as
+        candidates only. Falls back to the full scan when there is no LSH table,
+        no known query term, or fewer than k candidates.
+        """
+        if self.lsh is None or not len(query[0]):
+            return self.top_k(query, k)
+        rows = self.lsh.candidates(query, probes)
+        if len(rows) < k:
+            return self.top_k(query, k)
+        # Gathering scattered rows costs ~3x a sequential scan per row, so past a third of the corpus scan it all
+        scores = self.scores(query)[rows] if 3 * len(rows) > self.n_rows else self.scores_rows(query, rows)
+        return [(int(rows[i]), sim) for i, sim in top_k_rows(scores, k)]
+
+    def search(self, tf, k=5, mode="matrix"):
+        """
+        Weights a {word: tf} query once and dispatches to the retrieval mode
+        selected by the caller (see RETRIEVAL_MODES).
+        """
+        query = self.query_vector(tf)
+        if mode == "ann":
+            return self.top_k_ann(query, k)
+        if mode == "inverted":
+            return self.top_k_inverted(query, k)
+        if mode == "matrix":
+            return self.top_k(query, k)
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+
+def encode_rows(vectors, vocab, normalize=True):
+    """
+    Encodes an iterable of {word: weight} dicts as CSR arrays, extending vocab in
+    place. Rows are L2-normalized unless normalize is False.
+    """
+    indptr = [0]
+    indices = []
+    data = []
+    for vector in vectors:
+        for word, weight in vector.items():
+            indices.append(vocab.setdefault(word, len(vocab)))
+            data.append(weight)
+        indptr.append(len(indices))
+
+    indptr = np.asarray(indptr, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int32)
+    data = np.asarray(data, dtype=np.float64)
+    if normalize:
+        data = normalize_rows(indptr, data)
+    return indptr, indices, data
+
+
+def normalize_rows(indptr, data):
+    """Scales every CSR row to unit L2 norm (empty rows stay empty)."""
+    n_rows = len(indptr) - 1
+    row_ids = np.repeat(np.arange(n_rows), np.diff(indptr))
+    norms = np.sqrt(np.bincount(row_ids, weights=data ** 2, minlength=n_rows))
+    norms[norms == 0] = 1.0
+    return data / norms[row_ids]
+
+
+def pad_zero_rows(results, k, n_rows):
+    """
+    Completes a top-k list built from candidate rows only: movies sharing no term
+    with the query score 0 and are added in row order, exactly like the full scan.
+    """
+    if len(results) < k:
+        found = {row for row, _ in results}
+        for row in range(n_rows):
+            if len(results) >= k:
+                break
+            if row not in found:
+                results.append((row, 0.0))
+    return results
+
+
+def top_k_rows(scores, k):
+    """Selects the k best rows with argpartition; ties are broken by lowest row id."""
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    part = np.argpartition(-scores, k - 1)[:k]
+    kth = scores[part].min()
+    above = np.flatnonzero(scores > kth)
+    ties = np.flatnonzero(scores == kth)[:k - len(above)]
+    rows = np.concatenate([above, ties])
+    order = np.lexsort((rows, -scores[rows]))
+    return [(int(rows[i]), float(scores[rows[i]])) for i in order]
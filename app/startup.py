@@ -0,0 +1,52 @@
+"""
+Startup timing of the web / worker processes: how long each warm-up stage
+took and how long the process had been running when it became ready.
+"""
+import os
+import time
+from contextlib import contextmanager
+from metrics import register_stats
+
+# stage name -> seconds, in the order the stages ran
+_stages = {}
+_ready = {}
+
+
+def process_age():
+    """Seconds since this process was started (Linux /proc), or None."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return uptime - started_ticks / os.sysconf("SC_CLK_TCK")
+
+
+@contextmanager
+def stage(name):
+    """Records how long the block took under `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stages[name] = round(time.perf_counter() - start, 3)
+
+
+def report(label):
+    """Marks the process ready and prints the stage timings."""
+    age = process_age()
+    _ready.update(label=label, seconds=None if age is None else round(age, 3))
+    stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in _stages.items()) or "no warm-up"
+    total = "" if age is None else f" {age:.2f}s after process start"
+    print(f"[STARTUP] {label} (pid {os.getpid()}) ready{total}: {stages}")
+
+
+def startup_stats():
+    return {"ready": dict(_ready), "stages": dict(_stages)}
+
+
+register_stats("startup_stage_seconds", lambda: dict(_stages), label="stage")
+register_stats("startup", lambda: {"ready_seconds": _ready.get("seconds")})
@@ -1,23 +1,204 @@
-from celery_app import celery
-from selenium_scraper import scrape_top_movies
-from classifier import build_and_save_classifier
+import os
+import time
+import uuid
+from celery import chord
+from celery.signals import worker_init, worker_ready, task_prerun, task_postrun
+from celery_app import celery, INFERENCE_TIMEOUT, INFERENCE_BATCH_TIMEOUT
+from selenium_scraper import page_urls, scrape_page_fast, scrape_page_browser, save_movies, SELENIUM_MAX_SESSIONS
+from classifier import r, update_classifier, analyze_summaries, BuildLockTimeout, BuildLockExpired
+from micro_batch import MicroBatcher
+from create_tables import ensure_schema
+from text_cleaning import get_nlp, CLEANING_BACKEND
+import startup
+import metrics
+
+SESSION_SLOTS_KEY = "selenium_session_slots"
+# A slot older than this is treated as leaked by a crashed worker and reclaimed
+SELENIUM_SESSION_TIMEOUT = int(os.getenv("SELENIUM_SESSION_TIMEOUT", "600"))
+# Delay before a page task that found the grid full tries again
+SCRAPE_RETRY_SECONDS = int(os.getenv("SCRAPE_RETRY_SECONDS", "5"))
+# Delay before a classifier update that could not take the build lock tries again
+CLASSIFIER_RETRY_SECONDS = int(os.getenv("CLASSIFIER_RETRY_SECONDS", "30"))
+# page index -> movies found, per scrape run (the run id is the finish_scrape_task id)
+SCRAPE_RUN_KEY = "scrape_run:{}"
+SCRAPE_RUN_TTL_SECONDS = 86400
+
+# Concurrent predict_task calls in one worker are scored together; run the
+# inference worker with --pool threads so requests can actually overlap
+_batcher = MicroBatcher(analyze_summaries)
+
+# task id -> perf_counter at task start, for TASK_SECONDS
+_task_started = {}
+
+@worker_init.connect
+def _load_model(**kwargs):
+    # In the worker's main process, before the prefork pool forks its children
+    metrics.clear_multiproc_dir()
+    metrics.serve()
+    # Saving scrapes needs the natural-key index, which create_all alone never adds
+    ensure_schema()
+    if CLEANING_BACKEND == "spacy":
+        with startup.stage("spacy_model"):
+            get_nlp()
+
+@worker_ready.connect
+def _report_startup(**kwargs):
+    startup.report("celery worker")
+
+@task_prerun.connect
+def _task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _task_done(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        metrics.TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
 
 @celery.task
 def add(x, y):
     return x + y
 
+def _acquire_session_slot():
+    """Takes one of SELENIUM_MAX_SESSIONS slots (a Redis sorted set); returns its token or None."""
+    token = uuid.uuid4().hex
+    now = time.time()
+    pipe = r.pipeline()
+    pipe.zremrangebyscore(SESSION_SLOTS_KEY, "-inf", now - SELENIUM_SESSION_TIMEOUT)
+    pipe.zadd(SESSION_SLOTS_KEY, {token: now})
+    pipe.zrank(SESSION_SLOTS_KEY, token)
+    rank = pipe.execute()[-1]
+    if rank is not None and rank < SELENIUM_MAX_SESSIONS:
+        return token
+    r.zrem(SESSION_SLOTS_KEY, token)
+    return None
+
+def _release_session_slot(token):
+    r.zrem(SESSION_SLOTS_KEY, token)
+
+def _pages_cover_limit(run_id, page, limit):
+    """True once pages 0..page-1 of the run have all been scraped and hold limit movies between them."""
+    if page == 0:
+        return False
+    counts = r.hmget(SCRAPE_RUN_KEY.format(run_id), list(range(page)))
+    return None not in counts and sum(int(count) for count in counts) >= limit
+
+def _record_page(run_id, page, n_movies):
+    key = SCRAPE_RUN_KEY.format(run_id)
+    pipe = r.pipeline()
+    pipe.hset(key, page, n_movies)
+    pipe.expire(key, SCRAPE_RUN_TTL_SECONDS)
+    pipe.execute()
+
+def start_scrape(limit):
+    """
+    Queues scrape_movies_task (which fans out on the worker, where the
+    SCRAPE_PAGES / SCRAPE_URLS settings live) with a pre-generated id for its
+    finish_scrape_task. Returns that callback's AsyncResult, which only
+    succeeds once the movies are saved and the classifier is updated.
+    """
+    run_id = uuid.uuid4().hex
+    scrape_movies_task.delay(limit, run_id)
+    return finish_scrape_task.AsyncResult(run_id)
+
 @celery.task
-def scrape_movies_task(limit):
-    """
-    1. Run the Selenium Scraper to populate PostgreSQL.
-    2. Rebuild the NLP model and update Redis Cache.
-    """
-    print(f"[CELERY] Starting scrape task (limit={limit})")
-    
-    # Step 1: Scrape
-    scrape_top_movies(limit=limit)
-    
-    # Step 2: Update NLP "Brain"
-    build_and_save_classifier()
-    
-    return f"Successfully scraped {limit} movies and updated the classifier cache."
\ No newline at end of file
+def scrape_movies_task(limit, run_id=None):
+    """
+    1. Run the Selenium Scraper to populate PostgreSQL: one scrape_page_task
+       per listing page, each in its own browser session.
+    2. Rebuild the NLP model and update Redis Cache once all pages are in.
+    Returns the id of the finish_scrape_task that does step 2 (run_id, so the
+    web apps can hand it out before this task runs).
+    """
+    run_id = run_id or uuid.uuid4().hex
+    try:
+        urls = page_urls()
+        print(f"[CELERY] Starting scrape {run_id} (limit={limit}, pages={len(urls)})")
+        header = [scrape_page_task.s(url, run_id, page, limit) for page, url in enumerate(urls)]
+        chord(header)(finish_scrape_task.s(limit, run_id).set(task_id=run_id))
+    except Exception as e:
+        # Otherwise the id handed out by /scrape would stay PENDING forever
+        finish_scrape_task.backend.mark_as_failure(run_id, e)
+        raise
+    return run_id
+
+@celery.task(bind=True, max_retries=None)
+def scrape_page_task(self, url, run_id=None, page=0, limit=None):
+    """
+    Scrapes one page and returns the movie dicts. The browser fallback only
+    runs once a Selenium session slot is free. Pages after the ones that
+    already hold limit movies are not fetched at all.
+    """
+    if run_id is not None and limit is not None and _pages_cover_limit(run_id, page, limit):
+        print(f"[CELERY] Skipping {url}: earlier pages already hold {limit} movies")
+        _record_page(run_id, page, 0)
+        return []
+
+    movies = scrape_page_fast(url)
+    if movies is None:
+        token = _acquire_session_slot()
+        if token is None:
+            raise self.retry(countdown=SCRAPE_RETRY_SECONDS)
+        try:
+            movies = scrape_page_browser(url)
+        finally:
+            _release_session_slot(token)
+
+    if run_id is not None:
+        _record_page(run_id, page, len(movies))
+    return movies
+
+@celery.task(bind=True, max_retries=None)
+def finish_scrape_task(self, pages, limit, run_id=None, changed_ids=None, saved=None):
+    """
+    Chord callback: upserts the first limit movies (in page order) and updates
+    the classifier, unless no movie was inserted or changed. Routed to
+    REBUILD_QUEUE, whose solo-pool worker may fork for nlp.pipe.
+
+    When the build lock can't be had (or expired mid-update) only the update is
+    retried, with the changed ids of this scrape (saved = the save's summary).
+    """
+    movies = [movie for page in pages for movie in page][:limit]
+    if saved is None:
+        if run_id is not None:
+            r.delete(SCRAPE_RUN_KEY.format(run_id))
+        counts = save_movies(movies)
+        saved = f"{counts['inserted']} new, {counts['updated']} updated, {counts['unchanged']} unchanged"
+        if not counts["inserted"] and not counts["updated"]:
+            return f"Scraped {len(movies)} movies ({saved}); classifier left as is."
+        changed_ids = counts["updated_ids"]
+
+    # Update NLP "Brain" (only the new and changed movies are processed)
+    try:
+        update_classifier(changed_ids=changed_ids)
+    except (BuildLockTimeout, BuildLockExpired) as e:
+        print(f"[CELERY] Classifier update not applied ({e}), retrying in {CLASSIFIER_RETRY_SECONDS}s.")
+        raise self.retry(kwargs={"run_id": run_id, "changed_ids": changed_ids, "saved": saved},
+                         countdown=CLASSIFIER_RETRY_SECONDS, exc=e)
+
+    return f"Scraped {len(movies)} movies ({saved}) and updated the classifier cache."
+
+@celery.task
+def predict_task(summary, k=5):
+    """/predict on the inference queue: waits for a micro-batch and returns its slot."""
+    return _batcher.submit({"summary": summary, "k": k}).result(timeout=INFERENCE_TIMEOUT)
+
+def submit_predict(summary, k=5):
+    """Queues predict_task; expires with INFERENCE_TIMEOUT so abandoned requests are not scored."""
+    return predict_task.apply_async((summary, k), expires=INFERENCE_TIMEOUT)
+
+@celery.task
+def predict_batch_task(items):
+    """/predict/batch on the inference queue: the batch is already one analyze_summaries call."""
+    return analyze_summaries(items)
+
+def predict_batch_remote(items):
+    """
+    Runs predict_batch_task and waits for it (INFERENCE_BATCH_TIMEOUT, after which
+    the queued task also expires). Raises celery's TimeoutError.
+    """
+    result = predict_batch_task.apply_async((items,), expires=INFERENCE_BATCH_TIMEOUT)
+    try:
+        return result.get(timeout=INFERENCE_BATCH_TIMEOUT)
+    finally:
+        result.forget()
@@ -0,0 +1,92 @@
+import os
+import re
+import threading
+import multiprocessing
+
+# "spacy": en_core_web_sm tokenizer + lexical stop/punct flags
+# "fast": regex tokenizer + spaCy's English stop list, never runs the spaCy pipeline
+CLEANING_BACKEND = os.getenv("CLEANING_BACKEND", "spacy")
+CLEANING_BATCH_SIZE = int(os.getenv("CLEANING_BATCH_SIZE", "256"))
+# -1 uses every core of the container
+CLEANING_N_PROCESS = int(os.getenv("CLEANING_N_PROCESS", "-1"))
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+# Only the tokenizer and vocab are used: skip loading every trained component
+SPACY_EXCLUDE = ("tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner", "senter")
+
+_nlp = None
+_nlp_lock = threading.Lock()
+_stop_words = None
+
+# Contractions split like spaCy ("do" + "n't", "it" + "'s"), words optionally
+# joined by . or -, and any other single non-space character
+_FAST_TOKEN = re.compile(r"[^\W_]+(?=n't\b)|n't\b|'[^\W_]+|[^\W_]+(?:[.\-][^\W_]+)*|\S")
+
+
+def get_nlp():
+    """The spaCy pipeline, loaded on first use (importing spacy alone takes ~1 s)."""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(SPACY_MODEL, exclude=list(SPACY_EXCLUDE))
+    return _nlp
+
+
+def _get_stop_words():
+    global _stop_words
+    if _stop_words is None:
+        from spacy.lang.en.stop_words import STOP_WORDS
+        _stop_words = STOP_WORDS
+    return _stop_words
+
+
+def _keep(token):
+    # is_stop / is_punct are lexical attributes set by the tokenizer, so the
+    # tagger, parser and NER never have to run for them
+    return not token.is_stop and not token.is_punct
+
+
+def cleaning(summary, backend=None):
+    """Drops stop words and punctuation; returns the remaining words joined by spaces."""
+    if (backend or CLEANING_BACKEND) == "fast":
+        return _fast_cleaning(summary)
+    doc = get_nlp().make_doc(summary)
+    return " ".join(w.text for w in doc if _keep(w))
+
+
+def _fast_cleaning(summary):
+    stop_words = _get_stop_words()
+    words = [
+        w for w in _FAST_TOKEN.findall(summary)
+        if w.lower() not in stop_words and any(ch.isalnum() for ch in w)
+    ]
+    return " ".join(words)
+
+
+def clean_many(summaries, batch_size=None, n_process=None, backend=None):
+    """
+    Bulk version of cleaning() for classifier rebuilds: streams the summaries
+    through nlp.pipe with every pipeline component disabled, in batches and
+    across processes. Returns the cleaned strings in input order. Callers on a
+    request path pass n_process=1 (forking from a threaded process can deadlock).
+    """
+    backend = backend or CLEANING_BACKEND
+    if backend == "fast":
+        return [_fast_cleaning(s) for s in summaries]
+
+    batch_size = batch_size or CLEANING_BATCH_SIZE
+    n_process = n_process or CLEANING_N_PROCESS
+    if len(summaries) <= batch_size:
+        # Not worth forking for a single batch (e.g. small incremental updates)
+        n_process = 1
+    elif n_process != 1 and multiprocessing.current_process().daemon:
+        # Celery prefork children are daemonic and may not start processes of their own
+        print("[CLEANING] Daemon process, falling back to n_process=1 "
+              "(the rebuild queue's worker runs --pool solo to use every core).")
+        n_process = 1
+
+    nlp = get_nlp()
+    docs = nlp.pipe(summaries, batch_size=batch_size, n_process=n_process, disable=nlp.pipe_names)
+    return [" ".join(w.text for w in doc if _keep(w)) for doc in docs]
@@ -0,0 +1,69 @@
+import os
+import hashlib
+from sqlalchemy import insert, or_
+from models import Movie, MovieTokens
+from text_cleaning import clean_many, CLEANING_BACKEND
+
+# Rows cleaned / streamed per round trip
+TOKEN_BATCH_SIZE = int(os.getenv("TOKEN_BATCH_SIZE", "1000"))
+
+def summary_hash(summary):
+    return hashlib.sha256((summary or "").encode("utf-8")).hexdigest()
+
+def store_tokens(db, movies):
+    """
+    Cleans the given (flushed) Movie rows in one nlp.pipe batch and writes their
+    movie_tokens rows. Movies whose summary hash and backend already match are
+    skipped. The caller commits. Returns the number of rows (re)computed.
+    """
+    hashes = {m.id: summary_hash(m.summary) for m in movies}
+    existing = dict(
+        db.query(MovieTokens.movie_id, MovieTokens.summary_hash)
+        .filter(MovieTokens.movie_id.in_(hashes), MovieTokens.backend == CLEANING_BACKEND)
+    )
+    stale = [m for m in movies if existing.get(m.id) != hashes[m.id]]
+    if not stale:
+        return 0
+
+    cleaned = clean_many([m.summary or "" for m in stale])
+    stale_ids = [m.id for m in stale]
+    db.query(MovieTokens).filter(MovieTokens.movie_id.in_(stale_ids)).delete(synchronize_session=False)
+    db.execute(insert(MovieTokens), [
+        {"movie_id": m.id, "summary_hash": hashes[m.id], "backend": CLEANING_BACKEND, "tokens": text}
+        for m, text in zip(stale, cleaned)
+    ])
+    return len(stale)
+
+def ensure_tokens(db, ids=None):
+    """Backfills movies that have no tokens yet (or tokens from another backend), batch by batch."""
+    stale_query = (
+        db.query(Movie)
+        .outerjoin(MovieTokens, MovieTokens.movie_id == Movie.id)
+        .filter(or_(MovieTokens.movie_id.is_(None), MovieTokens.backend != CLEANING_BACKEND))
+        .order_by(Movie.id)
+    )
+    if ids is not None:
+        stale_query = stale_query.filter(Movie.id.in_(ids))
+
+    total = 0
+    while True:
+        batch = stale_query.limit(TOKEN_BATCH_SIZE).all()
+        if not batch:
+            break
+        total += store_tokens(db, batch)
+        db.commit()
+    if total:
+        print(f"[TOKENS] Cleaned and stored tokens for {total} movies.")
+    return total
+
+def stream_tokens(db, ids=None):
+    """Yields ({"id", "title"}, [tokens]) ordered by movie id, fetching TOKEN_BATCH_SIZE rows at a time."""
+    query = (
+        db.query(Movie.id, Movie.title, MovieTokens.tokens)
+        .join(MovieTokens, MovieTokens.movie_id == Movie.id)
+        .order_by(Movie.id)
+    )
+    if ids is not None:
+        query = query.filter(Movie.id.in_(ids))
+    for movie_id, title, tokens in query.yield_per(TOKEN_BATCH_SIZE):
+        yield {"id": movie_id, "title": title}, tokens.split()
@@ -0,0 +1,102 @@
+"""
+recall@k and query latency of the "ann" retrieval mode (LSH candidates +
+exact re-scoring) against the exact matrix scan, over a grid of LSH settings.
+
+Queries are random subsets of corpus summaries, so every query has a clear
+set of true neighbours.
+
+"top-1 hit" is the share of queries whose exact best match is among the ANN
+results; recall@k also counts the weak tail neighbours, which take far more
+candidates (tables, probes) to find.
+
+Usage: python benchmarks/ann_recall.py --movies 100000 --queries 200 --k 5 \
+           --tables 16,24,32 --bits 10,11 --probes 1,2,3
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+from collections import Counter
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sparse_index import SparseIndex  # noqa: E402
+from lsh_index import LSHIndex  # noqa: E402
+from index_format import synthetic_corpus, tf_idf  # noqa: E402
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def make_queries(documents, n_queries, keep, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = []
+    for doc_id in rng.choice(len(documents), size=n_queries, replace=False):
+        words = documents[doc_id]
+        sample = rng.choice(len(words), size=max(1, int(len(words) * keep)), replace=False)
+        counts = Counter(words[i] for i in sample)
+        queries.append({word: c / len(sample) for word, c in counts.items()})
+    return queries
+
+
+def timed(fn, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--movies", type=int, default=50000)
+    parser.add_argument("--vocab", type=int, default=30000)
+    parser.add_argument("--words", type=int, default=40, help="tokens per summary")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--keep", type=float, default=0.8, help="share of a summary's tokens used as query")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--tables", type=int_list, default=[16, 24, 32])
+    parser.add_argument("--bits", type=int_list, default=[10, 11])
+    parser.add_argument("--probes", type=int_list, default=[1, 2, 3])
+    args = parser.parse_args()
+
+    documents = synthetic_corpus(args.movies, args.vocab, args.words)
+    vectors = tf_idf(documents)
+    index = SparseIndex.from_vectors(vectors)
+    idf_by_word = {}
+    for vector, doc in zip(vectors, documents):
+        counts = Counter(doc)
+        for word, weight in vector.items():
+            idf_by_word.setdefault(word, weight * len(doc) / counts[word])
+    index.idf = np.array([idf_by_word[word] for word in index.terms], dtype=np.float32)
+    queries = [index.query_vector(tf) for tf in make_queries(documents, args.queries, args.keep)]
+
+    exact, exact_ms = timed(lambda q: index.top_k(q, args.k), queries)
+    exact_sets = [{row for row, _ in found} for found in exact]
+    exact_top = [found[0][0] for found in exact]
+    print(f"corpus: {args.movies} movies, vocab {args.vocab}, {args.words} tokens/summary; "
+          f"{args.queries} queries, k={args.k}")
+    print(f"exact matrix scan: p50 {np.median(exact_ms):.2f} ms, p95 {np.percentile(exact_ms, 95):.2f} ms")
+    print(f"{'tables':>6}{'bits':>6}{'probes':>8}{'build s':>9}{'cands':>9}"
+          f"{'recall@k':>10}{'top-1 hit':>11}{'p50 ms':>9}{'p95 ms':>9}{'speedup':>9}")
+
+    for tables, bits in itertools.product(args.tables, args.bits):
+        start = time.perf_counter()
+        index.lsh = LSHIndex.build(index, tables=tables, bits=bits)
+        build_s = time.perf_counter() - start
+        for probes in args.probes:
+            candidates = [len(index.lsh.candidates(q, probes)) for q in queries]
+            found, ms = timed(lambda q: index.top_k_ann(q, args.k, probes=probes), queries)
+            recall = np.mean([len({row for row, _ in f} & e) / len(e) for f, e in zip(found, exact_sets)])
+            top_hit = np.mean([any(row == top for row, _ in f) for f, top in zip(found, exact_top)])
+            print(f"{tables:>6}{bits:>6}{probes:>8}{build_s:>9.2f}{np.mean(candidates):>9.0f}"
+                  f"{recall:>10.3f}{top_hit:>11.3f}{np.median(ms):>9.2f}{np.percentile(ms, 95):>9.2f}"
+                  f"{np.median(exact_ms) / np.median(ms):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Cost of the nginx auth_request check, with and without verification caching.
+
+In-process (default): calls fast_app's /auth/verify through the ASGI test
+client with the token LRU disabled and enabled.
+
+    python benchmarks/auth_verify.py --requests 5000
+
+Against a running stack: sends authenticated GETs through nginx from several
+threads and reports latency percentiles. Run it once with the auth cache
+(proxy_cache + AUTH_CACHE_SIZE) and once without to compare.
+
+    python benchmarks/auth_verify.py --url http://localhost/movies?limit=1 --concurrency 16
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+
+def percentiles(latencies):
+    ms = np.array(latencies) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3)}
+
+
+def run_in_process(n_requests):
+    from fastapi.testclient import TestClient
+    import fast_app
+    from result_cache import LRUCache
+
+    token = fast_app.create_tokens("bench")["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client = TestClient(fast_app.app)
+
+    for label, size in (("no token cache", 0), ("token LRU", fast_app.AUTH_CACHE_SIZE or 10000)):
+        fast_app._verified_tokens = LRUCache(size, fast_app.AUTH_CACHE_MAX_AGE)
+        latencies = []
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            response = client.get("/auth/verify", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+        print(f"{label:>15}: {percentiles(latencies)}  "
+              f"Cache-Control={response.headers.get('cache-control')}")
+
+
+def run_http(url, token_url, n_requests, concurrency):
+    import requests
+
+    token = requests.post(token_url, json={"username": "admin", "password": "admin"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(count):
+        session = requests.Session()
+        for _ in range(count):
+            start = time.perf_counter()
+            response = session.get(url, headers=headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n_requests // concurrency,)) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    print(f"{len(latencies)} requests, {len(errors)} errors, {len(latencies) / wall:.0f} req/s, {percentiles(latencies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--url", help="protected URL behind nginx (enables the HTTP mode)")
+    parser.add_argument("--token-url", default="http://localhost/auth/token")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.url:
+        run_http(args.url, args.token_url, args.requests, args.concurrency)
+    else:
+        run_in_process(args.requests)
+
+
+if __name__ == "__main__":
+    main()
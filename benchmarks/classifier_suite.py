@@ -0,0 +1,362 @@
+"""
+Classifier build and query benchmarks on synthetic Zipfian corpora, run
+offline against SQLite and an in-process fake Redis (pip install fakeredis).
+
+For every corpus size:
+  build      cold build (cleaning + stored tokens + index + publish), rebuild
+             from stored tokens, incremental update after adding 1% new movies,
+             load of the published version
+  size       packed index bytes and the bytes stored in Redis
+  latency    analyze_summary p50/p95/p99 per retrieval mode, result cache off
+  batch      analyze_summaries queries/s
+  threads    analyze_summary queries/s with N threads in one process
+  processes  queries/s of N forked workers sharing the loaded index, and the
+             RSS / PSS (shared pages split between processes) of each worker
+  reference  the pure-Python compute_tf_idf + knn (corpora up to --reference-max)
+
+Results are written as JSON; --compare prints the change against an earlier
+run (e.g. one made on another commit).
+
+Usage: python benchmarks/classifier_suite.py --movies 1000,10000,100000
+       python benchmarks/classifier_suite.py --movies 10000 --compare classifier_suite-1a2b3c4.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+from index_format import synthetic_corpus  # noqa: E402
+
+# Movies generated and inserted per batch, so 1M-movie corpora stay out of memory
+INSERT_BATCH = 10000
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def str_list(value):
+    return [v for v in value.split(",") if v]
+
+
+def configure(args, workdir):
+    """App settings for an offline run; must happen before the app modules are imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["CLEANING_BACKEND"] = args.cleaning
+    os.environ["INDEX_DIR"] = ""
+    # Every query is scored, never answered from the result cache
+    os.environ["PREDICT_CACHE_SIZE"] = "0"
+    os.environ["PREDICT_REDIS_CACHE_TTL"] = "0"
+    os.environ["BUILD_ANN_INDEX"] = "1" if "ann" in args.modes else "0"
+
+
+def connect_fake_redis():
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("fakeredis is required: pip install fakeredis")
+    import classifier
+
+    fake = fakeredis.FakeRedis()
+    classifier.r = fake
+    classifier.result_cache.redis = fake
+    return fake
+
+
+def summaries(n_movies, args, seed):
+    """Summaries of n_movies movies, INSERT_BATCH at a time."""
+    for batch, start in enumerate(range(0, n_movies, INSERT_BATCH)):
+        size = min(INSERT_BATCH, n_movies - start)
+        for words in synthetic_corpus(size, args.vocab, args.words, seed=seed * 100003 + batch):
+            yield " ".join(words)
+
+
+def insert_movies(n_movies, args, first_id=0, seed=0):
+    from sqlalchemy import insert
+    from database import session_scope
+    from models import Movie
+
+    rows = []
+    with session_scope() as db:
+        for i, summary in enumerate(summaries(n_movies, args, seed), start=first_id):
+            rows.append({"title": f"Movie {i}", "year": 2000, "rating": 7.0, "summary": summary})
+            if len(rows) == INSERT_BATCH:
+                db.execute(insert(Movie), rows)
+                rows = []
+        if rows:
+            db.execute(insert(Movie), rows)
+        db.commit()
+
+
+def reset_store(fake):
+    from database import engine
+    from models import Base
+    import classifier
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    fake.flushdb()
+    classifier._cache["snapshot"] = None
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - start, 4)
+
+
+def percentiles(seconds):
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3)}
+
+
+def memory_kb():
+    """RSS and PSS of this process in kB (Linux /proc), else the peak RSS."""
+    found = {}
+    for path, field in (("/proc/self/status", "VmRSS"), ("/proc/self/smaps_rollup", "Pss")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field + ":"):
+                        found[field.lower().replace("vm", "")] = int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    if not found:
+        import resource
+        found["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return found
+
+
+def bench_build(n_movies, args, fake):
+    import classifier
+
+    reset_store(fake)
+    result = {"insert_s": timed(lambda: insert_movies(n_movies, args))}
+    # The build lock needs Lua scripting, which fakeredis only has with lupa;
+    # a single process never races for it, so the unlocked builders are timed
+    result["cold_build_s"] = timed(classifier._build_and_save)
+    result["rebuild_s"] = timed(classifier._build_and_save)
+
+    version = fake.get(classifier.VERSION_KEY)
+    data_key, manifest_key, _ = classifier._version_keys(version)
+    result["index_bytes"] = json.loads(fake.get(manifest_key))["bytes"]
+    result["stored_bytes"] = sum(len(chunk) for chunk in fake.lrange(data_key, 0, -1))
+
+    added = max(1, n_movies // 100)
+    insert_movies(added, args, first_id=n_movies, seed=1)
+    result["incremental_update_s"] = timed(classifier._update_classifier)
+    result["incremental_movies"] = added
+
+    classifier._cache["snapshot"] = None
+    result["load_s"] = timed(classifier.load_classifier)
+    return result
+
+
+def query_texts(args):
+    # Same distribution as the corpus, but summaries the index has not seen
+    return [" ".join(words) for words in synthetic_corpus(args.queries, args.vocab, args.words, seed=7)]
+
+
+def bench_latency(queries, args):
+    import classifier
+
+    result = {}
+    for mode in args.modes:
+        latencies = []
+        for summary in queries:
+            start = time.perf_counter()
+            classifier.analyze_summary(summary, args.k, mode=mode)
+            latencies.append(time.perf_counter() - start)
+        result[mode] = percentiles(latencies)
+    return result
+
+
+def bench_batch(queries, args):
+    import classifier
+
+    items = [{"summary": summary, "k": args.k} for summary in queries]
+    result = {}
+    for mode in args.modes:
+        seconds = timed(lambda: classifier.analyze_summaries(items, mode=mode))
+        result[mode] = {"queries_per_s": round(len(items) / seconds, 1)}
+    return result
+
+
+def bench_threads(queries, args):
+    import classifier
+
+    result = {}
+    for n in args.concurrency:
+        with ThreadPoolExecutor(n) as pool:
+            seconds = timed(lambda: list(pool.map(
+                lambda summary: classifier.analyze_summary(summary, args.k, mode=args.modes[0]), queries)))
+        result[str(n)] = {"queries_per_s": round(len(queries) / seconds, 1)}
+    return result
+
+
+def _worker(queries, args, start_event, results):
+    import classifier
+
+    start_event.wait()
+    start = time.perf_counter()
+    for summary in queries:
+        classifier.analyze_summary(summary, args.k, mode=args.modes[0])
+    results.put({"seconds": time.perf_counter() - start, "memory_kb": memory_kb()})
+
+
+def bench_processes(queries, args):
+    """Forked after the index is loaded, like gunicorn preload or the inference pool."""
+    ctx = multiprocessing.get_context("fork")
+    result = {}
+    for n in args.concurrency:
+        start_event, results = ctx.Event(), ctx.Queue()
+        workers = [ctx.Process(target=_worker, args=(queries[i::n], args, start_event, results))
+                   for i in range(n)]
+        for worker in workers:
+            worker.start()
+        start_event.set()
+        reports = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        slowest = max(report["seconds"] for report in reports)
+        memory = [report["memory_kb"] for report in reports]
+        result[str(n)] = {
+            "queries_per_s": round(len(queries) / slowest, 1),
+            "worker_memory_kb": {key: int(np.mean([m[key] for m in memory])) for key in memory[0]},
+        }
+    return result
+
+
+def bench_reference(n_movies, args):
+    """The original dict-of-words implementation, for scale."""
+    from classifier import compute_tf_idf, compute_tf, knn
+
+    documents = synthetic_corpus(n_movies, args.vocab, args.words)
+    result = {}
+    start = time.perf_counter()
+    vectors = compute_tf_idf(documents)
+    result["compute_tf_idf_s"] = round(time.perf_counter() - start, 4)
+    latencies = []
+    for words in synthetic_corpus(min(args.queries, 20), args.vocab, args.words, seed=7):
+        start = time.perf_counter()
+        knn(vectors, compute_tf(words), args.k)
+        latencies.append(time.perf_counter() - start)
+    result["knn"] = percentiles(latencies)
+    return result
+
+
+def run_size(n_movies, args, fake):
+    import classifier
+
+    print(f"\n== {n_movies} movies")
+    result = {"movies": n_movies, "build": bench_build(n_movies, args, fake)}
+    print(f"build: {result['build']}")
+    queries = query_texts(args)
+    classifier.load_classifier()
+    result["memory_after_load_kb"] = memory_kb()
+    result["latency"] = bench_latency(queries, args)
+    print(f"latency: {result['latency']}")
+    result["batch"] = bench_batch(queries, args)
+    print(f"batch: {result['batch']}")
+    result["threads"] = bench_threads(queries, args)
+    print(f"threads: {result['threads']}")
+    result["processes"] = bench_processes(queries, args)
+    print(f"processes: {result['processes']}")
+    if n_movies <= args.reference_max:
+        result["reference"] = bench_reference(n_movies, args)
+        print(f"reference: {result['reference']}")
+    return result
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=APP_DIR, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=APP_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+        return flat
+    return {prefix: value} if isinstance(value, (int, float)) else {}
+
+
+def compare(baseline_path, results):
+    """Prints every metric that both runs measured for the same corpus size."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old_by_size = {run["movies"]: flatten(run) for run in baseline["results"]}
+    print(f"\nchange vs {baseline_path} (commit {baseline['meta']['commit']})")
+    for run in results:
+        old = old_by_size.get(run["movies"])
+        if old is None:
+            continue
+        print(f"-- {run['movies']} movies")
+        for key, new_value in flatten(run).items():
+            old_value = old.get(key)
+            if key == "movies" or not old_value:
+                continue
+            print(f"{key:<48}{old_value:>14.4g}{new_value:>14.4g}{new_value / old_value:>9.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int_list, default=[1000, 10000])
+    parser.add_argument("--vocab", type=int, default=30000)
+    parser.add_argument("--words", type=int, default=40, help="tokens per summary")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modes", type=str_list, default=["matrix", "inverted", "ann"],
+                        help="retrieval modes; the first one is used for the concurrency runs")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 2, 4])
+    parser.add_argument("--cleaning", choices=("fast", "spacy"), default="fast",
+                        help="text_cleaning backend (spacy needs en_core_web_sm)")
+    parser.add_argument("--reference-max", type=int, default=10000)
+    parser.add_argument("--output", help="JSON results file (default classifier_suite-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(args, workdir)
+        fake = connect_fake_redis()
+        results = [run_size(n_movies, args, fake) for n_movies in args.movies]
+
+    meta = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+    output = args.output or f"classifier_suite-{meta['commit']}.json"
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"\nresults written to {output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
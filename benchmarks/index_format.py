@@ -0,0 +1,74 @@
+"""
+Compares the old pickled classifier_data (list of {word: float} dicts) with the
+packed binary index: serialized size and load time.
+
+Usage: python benchmarks/index_format.py --movies 20000 --vocab 30000
+"""
+import os
+import sys
+import math
+import time
+import pickle
+import argparse
+from collections import Counter
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sparse_index import SparseIndex  # noqa: E402
+from index_store import pack_index, unpack_index  # noqa: E402
+
+
+def synthetic_corpus(n_movies, vocab_size, words_per_summary, seed=0):
+    """Token lists drawn from a Zipfian vocabulary, like real plot summaries."""
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}" for i in range(vocab_size)])
+    ranks = np.minimum(rng.zipf(1.2, size=n_movies * words_per_summary), vocab_size) - 1
+    return [list(vocab[ranks[i:i + words_per_summary]]) for i in range(0, len(ranks), words_per_summary)]
+
+
+def tf_idf(documents):
+    df = Counter(word for doc in documents for word in set(doc))
+    idf = {word: math.log(len(documents) / count) + 1 for word, count in df.items()}
+    vectors = []
+    for doc in documents:
+        counts = Counter(doc)
+        vectors.append({word: c / len(doc) * idf[word] for word, c in counts.items()})
+    return vectors
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--movies", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=30000)
+    parser.add_argument("--words", type=int, default=40, help="tokens per summary")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = synthetic_corpus(args.movies, args.vocab, args.words)
+    vectors = tf_idf(documents)
+    movies = [{"id": i, "title": f"Movie {i}"} for i in range(len(documents))]
+
+    old_blob = pickle.dumps({"movies": movies, "vectors": vectors})
+    new_blob = pack_index(movies, SparseIndex.from_vectors(vectors), {"cleaning": "spacy"})
+
+    old_load = best_of(lambda: pickle.loads(old_blob), args.repeat)
+    new_load = best_of(lambda: unpack_index(new_blob), args.repeat)
+
+    print(f"corpus: {len(movies)} movies, {args.words} tokens/summary, vocab {args.vocab}")
+    print(f"{'format':<12}{'size (MB)':>12}{'load (ms)':>12}")
+    print(f"{'pickle':<12}{len(old_blob) / 1e6:>12.2f}{old_load * 1e3:>12.1f}")
+    print(f"{'packed':<12}{len(new_blob) / 1e6:>12.2f}{new_load * 1e3:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
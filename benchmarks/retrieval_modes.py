@@ -0,0 +1,89 @@
+"""
+Query latency of the exact retrieval paths of SparseIndex by query length:
+the full matrix scan (top_k), the posting-list scorer (top_k_inverted) and the
+batched sparse product (top_k_batch) against looping top_k.
+
+Queries are random subsets of corpus summaries, so short queries read a few
+posting lists while long ones approach the full scan. Every path is checked
+to return the same rows as top_k.
+
+Usage: python benchmarks/retrieval_modes.py --movies 30000 --lengths 3,5,10,40 --queries 200
+"""
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sparse_index import SparseIndex, sparse  # noqa: E402
+from index_format import synthetic_corpus, tf_idf  # noqa: E402
+from ann_recall import int_list  # noqa: E402
+
+
+def make_queries(index, documents, n_queries, length, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = []
+    for doc_id in rng.choice(len(documents), size=n_queries, replace=False):
+        words = documents[doc_id]
+        sample = rng.choice(len(words), size=min(length, len(words)), replace=False)
+        counts = Counter(words[i] for i in sample)
+        queries.append(index.query_vector({word: c / len(sample) for word, c in counts.items()}))
+    return queries
+
+
+def timed(fn, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+
+def same_rows(a, b):
+    return all({row for row, _ in x} == {row for row, _ in y} for x, y in zip(a, b))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--movies", type=int, default=30000)
+    parser.add_argument("--vocab", type=int, default=30000)
+    parser.add_argument("--words", type=int, default=40, help="tokens per summary")
+    parser.add_argument("--lengths", type=int_list, default=[3, 5, 10, 40], help="query lengths in tokens")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = synthetic_corpus(args.movies, args.vocab, args.words)
+    index = SparseIndex.from_vectors(tf_idf(documents))
+    print(f"corpus: {args.movies} movies, {len(index.data)} stored values; k={args.k}, "
+          f"batch of {args.batch} {'(scipy)' if sparse is not None else '(no scipy: per-query fallback)'}")
+    print(f"{'tokens':>6}{'matrix p50':>12}{'inverted p50':>14}{'speedup':>9}"
+          f"{'loop ms':>10}{'batch ms':>10}{'speedup':>9}{'same rows':>11}")
+
+    for length in args.lengths:
+        queries = make_queries(index, documents, args.queries, length)
+        exact, matrix_ms = timed(lambda q: index.top_k(q, args.k), queries)
+        inverted, inverted_ms = timed(lambda q: index.top_k_inverted(q, args.k), queries)
+
+        block = queries[:args.batch]
+        start = time.perf_counter()
+        for query in block:
+            index.top_k(query, args.k)
+        loop_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        batched = index.top_k_batch(block, [args.k] * len(block))
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        same = same_rows(exact, inverted) and same_rows(exact[:len(block)], batched)
+        print(f"{length:>6}{np.median(matrix_ms):>12.2f}{np.median(inverted_ms):>14.2f}"
+              f"{np.median(matrix_ms) / np.median(inverted_ms):>8.1f}x"
+              f"{loop_ms:>10.1f}{batch_ms:>10.1f}{loop_ms / batch_ms:>8.1f}x{str(same):>11}")
+
+
+if __name__ == "__main__":
+    main()
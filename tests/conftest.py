@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+# The app modules create their engine at import: a throwaway SQLite file unless a database is given
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/tests.db")
+# Regex cleaning: the tests must not depend on a downloaded spaCy model
+os.environ.setdefault("CLEANING_BACKEND", "fast")
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture
+def db_engine():
+    """Empty movies / movie_tokens tables (with the natural-key index)."""
+    from database import Base, engine
+    import models  # noqa: F401  (registers the tables)
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return engine
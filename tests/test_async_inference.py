@@ -0,0 +1,40 @@
+import asyncio
+import os
+import signal
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import classifier
+from async_inference import InferencePool, Overloaded, _worker_pid
+
+
+@pytest.fixture
+def pool():
+    pool = InferencePool(processes=2, mode="local")
+    pool.start()
+    pool.redis = fakeredis.aioredis.FakeRedis()
+    yield pool
+    pool.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def test_dead_worker_answers_503_and_replaces_the_pool(pool):
+    asyncio.run(pool.redis.set(classifier.VERSION_KEY, 1))
+    broken = pool.executor
+    for process in list(broken._processes.values()):
+        try:
+            os.kill(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # the executor already took it down with the first one
+        process.join()
+
+    with pytest.raises(Overloaded):
+        asyncio.run(pool.predict("a spy in paris"))
+    assert pool.executor is not broken
+    assert pool.stats()["pool_restarts"] == 1
+    assert pool.executor.submit(_worker_pid).result(timeout=60) > 0
+
+    # A second failure report for the old pool leaves the new one alone
+    replacement = pool.executor
+    pool._replace_pool(broken)
+    assert pool.executor is replacement
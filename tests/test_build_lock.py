@@ -0,0 +1,48 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # redis-py locks run Lua scripts
+
+import classifier
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = fakeredis.FakeRedis()
+    monkeypatch.setattr(classifier, "r", fake)
+    monkeypatch.setattr(classifier, "INDEX_BUILD_LOCK_WAIT", 0.1)
+    return fake
+
+
+def test_busy_lock_raises_without_applying(fake_redis, monkeypatch):
+    applied = []
+    monkeypatch.setattr(classifier, "_update_classifier", applied.append)
+    other = fake_redis.lock(classifier.BUILD_LOCK_KEY, timeout=60)
+    assert other.acquire()
+    with pytest.raises(classifier.BuildLockTimeout):
+        classifier.update_classifier([1, 2])
+    assert applied == []
+
+
+def test_expired_lock_is_reported_after_the_update(fake_redis, monkeypatch):
+    applied = []
+
+    def update(changed_ids):
+        applied.append(changed_ids)
+        fake_redis.delete(classifier.BUILD_LOCK_KEY)  # as if INDEX_BUILD_LOCK_TIMEOUT passed
+
+    monkeypatch.setattr(classifier, "_update_classifier", update)
+    with pytest.raises(classifier.BuildLockExpired):
+        classifier.update_classifier([3])
+    assert applied == [[3]]
+
+
+def test_update_errors_win_over_a_lost_lock(fake_redis, monkeypatch):
+    def update(changed_ids):
+        fake_redis.delete(classifier.BUILD_LOCK_KEY)
+        raise KeyError("boom")
+
+    monkeypatch.setattr(classifier, "_update_classifier", update)
+    with pytest.raises(KeyError):
+        classifier.update_classifier([4])
+    assert fake_redis.get(classifier.BUILD_LOCK_KEY) is None
@@ -0,0 +1,62 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import classifier
+from database import session_scope
+from ingest import upsert_movies
+from models import Movie
+
+SUMMARIES = [
+    ("Harbor Lights", "A retired lighthouse keeper uncovers a smuggling ring at the ferry dock."),
+    ("The Quiet Year", "Two estranged sisters spend a winter restoring their father's orchard."),
+    ("Festival Cut", "A documentary crew follows a small film through its first festival."),
+    ("Night Ferry", "A ferry captain and a smuggler share one stormy crossing."),
+]
+
+
+@pytest.fixture
+def published(db_engine, monkeypatch):
+    monkeypatch.setattr(classifier, "r", fakeredis.FakeRedis())
+    # Keep the published weights, so the update takes the in-place DF path
+    monkeypatch.setattr(classifier, "IDF_DRIFT_THRESHOLD", float("inf"))
+    with session_scope() as db:
+        upsert_movies(db, [{"title": title, "year": 2024, "summary": summary} for title, summary in SUMMARIES])
+        db.commit()
+    classifier._build_and_save()
+
+
+def published_df():
+    return classifier._fetch_published()["state"]["df"]
+
+
+def test_df_follows_removed_changed_and_added_movies(published):
+    with session_scope() as db:
+        # Not the newest row: SQLite would hand its id to the inserted movie
+        db.query(Movie).filter(Movie.title == "Harbor Lights").delete()
+        counts = upsert_movies(db, [
+            {"title": "The Quiet Year", "year": 2024, "summary": "Two sisters open a bakery in a harbor town."},
+            {"title": "Paper Moons", "year": 2024, "summary": "A lighthouse painter chases comets."},
+        ])
+        db.commit()
+
+    classifier._update_classifier(changed_ids=counts["updated_ids"])
+    updated = classifier._fetch_published()
+    df = updated["state"]["df"]
+    assert "smuggling" not in df and "orchard" not in df
+    assert df["ferry"] == 1 and df["lighthouse"] == 1 and df["sisters"] == 1 and df["bakery"] == 1
+
+    # The changed movie is re-indexed with its new words
+    row = next(row for row, m in enumerate(updated["movies"]) if m["id"] == counts["updated_ids"][0])
+    assert "bakery" in updated["index"].row_terms(row) and "orchard" not in updated["index"].row_terms(row)
+
+    classifier._build_and_save()
+    assert df == published_df()
+
+
+def test_changed_ids_outside_the_index_are_ignored(published):
+    before = published_df()
+    with session_scope() as db:
+        missing_id = db.query(Movie.id).order_by(Movie.id.desc()).first()[0] + 100
+    classifier._update_classifier(changed_ids=[missing_id])
+    assert published_df() == before
@@ -0,0 +1,75 @@
+import random
+import numpy as np
+import pytest
+import index_store
+from classifier import compute_tf, compute_tf_idf
+from index_store import pack_index, unpack_index, to_chunks, from_chunks, write_index_file, open_index_file
+from sparse_index import SparseIndex
+from lsh_index import LSHIndex
+
+WORDS = [f"w{i}" for i in range(40)] + ["café", "naïve", "東京"]
+
+
+@pytest.fixture(scope="module")
+def published():
+    rng = random.Random(5)
+    documents = [rng.choices(WORDS, k=rng.randint(2, 15)) for _ in range(120)]
+    movies = [{"id": 1000 + i, "title": f"Movie {i} – ü" if i % 9 else None} for i in range(len(documents))]
+    index = SparseIndex.from_vectors(compute_tf_idf(documents))
+    index.idf = np.linspace(1, 3, len(index.terms)).astype(np.float32)
+    index.lsh = LSHIndex.build(index, tables=6, bits=5, seed=3)
+    return movies, index, documents
+
+
+def assert_same_index(index, expected):
+    assert list(index.terms) == list(expected.terms)
+    for name in ("indptr", "indices", "data", "post_ptr", "post_rows", "post_weights", "term_max", "idf"):
+        assert np.array_equal(getattr(index, name), getattr(expected, name)), name
+    assert all(index.vocab.get(word) == col for word, col in expected.vocab.items())
+    assert index.vocab.get("unseen") is None
+
+
+def test_round_trip_with_lsh(published):
+    movies, index, documents = published
+    unpacked_movies, unpacked, meta = unpack_index(pack_index(movies, index, {"version": 7, "cleaning": "fast"}))
+
+    assert list(unpacked_movies) == [{"id": m["id"], "title": m["title"] or ""} for m in movies]
+    assert meta["version"] == 7 and meta["cleaning"] == "fast"
+    assert_same_index(unpacked, index)
+
+    assert meta["lsh"] == index.lsh.params()
+    assert unpacked.lsh.params() == index.lsh.params()
+    assert np.array_equal(unpacked.lsh.keys, index.lsh.keys)
+    assert np.array_equal(unpacked.lsh.rows, index.lsh.rows)
+    for words in documents[:20]:
+        tf = compute_tf(words)
+        assert unpacked.search(tf, k=5, mode="ann") == index.search(tf, k=5, mode="ann")
+
+
+def test_round_trip_without_lsh(published):
+    movies, index, _ = published
+    plain = SparseIndex(index.terms, index.indptr, index.indices, index.data, idf=index.idf)
+    _, unpacked, meta = unpack_index(pack_index(movies, plain))
+    assert "lsh" not in meta and unpacked.lsh is None
+    assert_same_index(unpacked, plain)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_chunks_and_index_file(published, tmp_path, monkeypatch, compress):
+    movies, index, _ = published
+    monkeypatch.setattr(index_store, "INDEX_CHUNK_BYTES", 1000)
+    monkeypatch.setattr(index_store, "INDEX_COMPRESS", compress)
+    blob = pack_index(movies, index)
+    chunks, manifest = to_chunks(blob)
+    assert len(chunks) > 1
+    assert from_chunks(chunks, manifest) == blob
+
+    write_index_file(blob, str(tmp_path))
+    _, mapped, _ = unpack_index(open_index_file(str(tmp_path)))
+    assert_same_index(mapped, index)
+    assert np.array_equal(mapped.lsh.keys, index.lsh.keys)
+
+
+def test_rejects_foreign_buffers():
+    with pytest.raises(ValueError):
+        unpack_index(b"not an index at all")
@@ -0,0 +1,65 @@
+from database import session_scope
+from ingest import upsert_movies
+from models import Movie, MovieTokens
+from token_store import summary_hash
+
+
+def movie(title, year, summary):
+    return {"title": title, "year": year, "summary": summary}
+
+
+def upsert(movies):
+    with session_scope() as db:
+        counts = upsert_movies(db, movies)
+        db.commit()
+    return counts
+
+
+def stored(db):
+    return {(m.title, m.year): (m.id, m.summary) for m in db.query(Movie)}
+
+
+def test_counts_and_updated_ids(db_engine):
+    first = upsert([movie("Harbor Lights", 2024, "A keeper."), movie("The Quiet Year", 2023, "Two sisters."),
+                    movie("Festival Cut", None, "A crew.")])
+    assert first == {"inserted": 3, "updated": 0, "unchanged": 0, "updated_ids": []}
+
+    with session_scope() as db:
+        ids = {key: movie_id for key, (movie_id, _) in stored(db).items()}
+    second = upsert([
+        movie("Harbor Lights", 2024, "A keeper."),          # unchanged
+        movie("The Quiet Year", 2023, "Two sisters, one orchard."),
+        movie("The Quiet Year", 2022, "Same title, other year."),
+    ])
+    assert second == {"inserted": 1, "updated": 1, "unchanged": 1,
+                      "updated_ids": [ids[("The Quiet Year", 2023)]]}
+    with session_scope() as db:
+        rows = stored(db)
+    assert len(rows) == 4
+    assert rows[("The Quiet Year", 2023)] == (ids[("The Quiet Year", 2023)], "Two sisters, one orchard.")
+
+
+def test_null_year_updates_in_place(db_engine):
+    upsert([movie("Festival Cut", None, "A crew."), movie("Festival Cut", 2024, "Dated cut.")])
+    with session_scope() as db:
+        movie_id = stored(db)[("Festival Cut", None)][0]
+
+    # NULL never conflicts in the unique index: this must not insert a second undated row
+    counts = upsert([movie("Festival Cut", None, "A crew and a film.")])
+    assert counts == {"inserted": 0, "updated": 1, "unchanged": 0, "updated_ids": [movie_id]}
+    assert upsert([movie("Festival Cut", None, "A crew and a film.")])["unchanged"] == 1
+
+    with session_scope() as db:
+        rows = stored(db)
+        tokens = db.query(MovieTokens).filter(MovieTokens.movie_id == movie_id).one()
+    assert rows == {("Festival Cut", None): (movie_id, "A crew and a film."),
+                    ("Festival Cut", 2024): (rows[("Festival Cut", 2024)][0], "Dated cut.")}
+    # The tokens follow the new summary
+    assert tokens.summary_hash == summary_hash("A crew and a film.")
+
+
+def test_duplicates_in_one_scrape(db_engine):
+    counts = upsert([movie("Harbor Lights", 2024, "Old."), movie("Harbor Lights", 2024, "New.")])
+    assert counts["inserted"] == 1
+    with session_scope() as db:
+        assert stored(db)[("Harbor Lights", 2024)][1] == "New."
@@ -0,0 +1,46 @@
+import json
+import pytest
+from database import session_scope
+from models import Movie
+from movie_listing import parse_limit, MOVIES_PAGE_SIZE
+
+
+@pytest.fixture
+def movies(db_engine):
+    n = MOVIES_PAGE_SIZE + 50
+    with session_scope() as db:
+        db.add_all([Movie(title=f"m{i}", year=2000 + i % 20, summary="x" * 150) for i in range(n)])
+        db.commit()
+    return n
+
+
+def test_parse_limit_defaults():
+    assert parse_limit(None) == MOVIES_PAGE_SIZE
+    assert parse_limit(None, ndjson=True) == 0
+    assert parse_limit("7", ndjson=True) == 7
+    with pytest.raises(ValueError):
+        parse_limit("-1")
+
+
+def test_flask_ndjson_streams_past_the_page_size(movies):
+    import app as flask_app
+
+    client = flask_app.app.test_client()
+    lines = client.get("/movies?format=ndjson&fields=id").get_data(as_text=True).splitlines()
+    assert len(lines) == movies
+    after = json.loads(lines[9])["id"]
+    rest = client.get(f"/movies?format=ndjson&fields=id&after_id={after}").get_data(as_text=True).splitlines()
+    assert len(rest) == movies - 10
+
+    page = client.get("/movies?fields=id")
+    assert len(page.get_json()) == MOVIES_PAGE_SIZE
+    assert "X-Next-After-Id" in page.headers
+
+
+def test_fastapi_ndjson_streams_past_the_page_size(movies):
+    from fastapi.testclient import TestClient
+    import fast_app
+
+    client = TestClient(fast_app.app)  # no startup events: nothing to warm up here
+    assert len(client.get("/movies?format=ndjson&fields=id").text.splitlines()) == movies
+    assert len(client.get("/movies?format=ndjson&fields=id&limit=5").text.splitlines()) == 5
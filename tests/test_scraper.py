@@ -0,0 +1,59 @@
+import os
+import pytest
+from conftest import FIXTURES
+import selenium_scraper
+from selenium_scraper import parse_movie_blocks, scrape_page_fast
+
+LISTING_PAGE = os.path.join(FIXTURES, "listing_page.html")
+
+EXPECTED = [
+    {
+        "title": "Harbor Lights",
+        "year": 2024,
+        "summary": "A retired lighthouse keeper uncovers a smuggling ring operating out of the town’s ferry dock.",
+    },
+    {
+        "title": "The Quiet Year",
+        "year": 2023,
+        "summary": "Two estranged sisters spend a winter restoring their late father’s orchard.",
+    },
+    {
+        "title": "Festival Cut",
+        "year": None,
+        "summary": "A documentary crew follows a small film through its first festival run.",
+    },
+]
+
+
+@pytest.fixture(params=["lxml", "html.parser"])
+def parser(request, monkeypatch):
+    # lxml is optional; both parsers must agree on the layout
+    if request.param == "lxml":
+        pytest.importorskip("lxml")
+    monkeypatch.setattr(selenium_scraper, "HTML_PARSER", request.param)
+
+
+@pytest.fixture
+def listing_html(parser):
+    with open(LISTING_PAGE, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_parses_title_year_and_summary(listing_html):
+    assert parse_movie_blocks(listing_html) == EXPECTED
+
+
+def test_skips_malformed_blocks(listing_html, capsys):
+    titles = [movie["title"] for movie in parse_movie_blocks(listing_html)]
+    assert "No Summary" not in titles
+    assert "Coming Soon" not in titles
+    assert capsys.readouterr().out.count("[WARN] Failed to parse block") == 2
+
+
+def test_page_without_blocks(parser):
+    assert parse_movie_blocks("<html><body><p>Maintenance</p></body></html>") == []
+
+
+def test_scrape_page_fast_reads_saved_pages(parser):
+    assert scrape_page_fast(LISTING_PAGE) == EXPECTED
+    assert scrape_page_fast("file://" + LISTING_PAGE) == EXPECTED
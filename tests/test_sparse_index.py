@@ -0,0 +1,91 @@
+import math
+import random
+import numpy as np
+import pytest
+from classifier import compute_tf, compute_idf, compute_tf_idf, knn
+from sparse_index import SparseIndex, RETRIEVAL_MODES
+from lsh_index import LSHIndex
+
+WORDS = [f"w{i}" for i in range(60)]
+EXACT_MODES = [mode for mode in RETRIEVAL_MODES if mode != "ann"]
+
+
+def make_documents(n_docs=300, seed=3):
+    rng = random.Random(seed)
+    # Skewed word choice, so documents share common words and have a clear ranking
+    return [rng.choices(WORDS, weights=range(len(WORDS), 0, -1), k=rng.randint(3, 25)) for _ in range(n_docs)]
+
+
+def make_queries(n_queries=40, seed=11):
+    rng = random.Random(seed)
+    queries = [rng.choices(WORDS + ["unseen"], k=rng.randint(1, 12)) for _ in range(n_queries)]
+    return queries + [["unseen"], []]
+
+
+def assert_same_ranking(found, expected):
+    assert [row for row, _ in found] == [row for row, _ in expected]
+    assert [sim for _, sim in found] == pytest.approx([sim for _, sim in expected], abs=1e-5)
+
+
+@pytest.fixture(scope="module")
+def documents():
+    return make_documents()
+
+
+@pytest.mark.parametrize("mode", EXACT_MODES)
+@pytest.mark.parametrize("k", [1, 5, 400])
+def test_search_matches_knn(documents, mode, k):
+    # Original scoring: TF-IDF movie vectors against the plain TF of the query
+    vectors = compute_tf_idf(documents)
+    index = SparseIndex.from_vectors(vectors)
+    for words in make_queries():
+        tf = compute_tf(words)
+        assert_same_ranking(index.search(tf, k=k, mode=mode), knn(vectors, tf, k=k))
+
+
+@pytest.mark.parametrize("mode", EXACT_MODES)
+def test_idf_weighted_search_matches_knn(documents, mode):
+    vectors = compute_tf_idf(documents)
+    idf = compute_idf(documents)
+    index = SparseIndex.from_vectors(vectors)
+    index.idf = np.array([idf[word] for word in index.terms], dtype=np.float32)
+    unseen_idf = math.log(len(documents)) + 1
+    for words in make_queries():
+        tf = compute_tf(words)
+        weighted = {word: value * idf.get(word, unseen_idf) for word, value in tf.items()}
+        assert_same_ranking(index.search(tf, k=5, mode=mode), knn(vectors, weighted, k=5))
+
+
+def test_batch_matches_single_queries(documents):
+    index = SparseIndex.from_vectors(compute_tf_idf(documents))
+    queries = [index.query_vector(compute_tf(words)) for words in make_queries()]
+    ks = [1 + i % 7 for i in range(len(queries))]
+    for found, query, k in zip(index.top_k_batch(queries, ks), queries, ks):
+        assert_same_ranking(found, index.top_k(query, k))
+
+
+def test_ann_finds_the_best_match(documents):
+    index = SparseIndex.from_vectors(compute_tf_idf(documents))
+    index.lsh = LSHIndex.build(index)
+    for words in documents[:40]:
+        tf = compute_tf(words)
+        assert index.search(tf, k=5, mode="ann")[0] == pytest.approx(index.search(tf, k=5)[0], abs=1e-5)
+
+
+def table_entries(lsh):
+    """(table, key, row) triples; the order of rows within one bucket is irrelevant."""
+    tables = np.repeat(np.arange(lsh.tables), lsh.keys.shape[1])
+    entries = np.stack([tables, lsh.keys.ravel().astype(np.int64), lsh.rows.ravel()])
+    return entries[:, np.lexsort(entries[::-1])]
+
+
+def test_lsh_with_rows_matches_build(documents):
+    vectors = compute_tf_idf(documents)
+    index = SparseIndex.from_vectors(vectors[:250])
+    index.lsh = LSHIndex.build(index)
+    keep_rows = [row for row in range(250) if row % 7]
+    updated = index.with_rows(keep_rows, vectors[250:])
+
+    lsh = index.lsh.with_rows(keep_rows, updated)
+    assert np.array_equal(table_entries(lsh), table_entries(LSHIndex.build(updated)))
+    assert all(np.all(keys[1:] >= keys[:-1]) for keys in lsh.keys)